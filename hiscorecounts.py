@@ -76,7 +76,7 @@ def parse_args() -> argparse.Namespace:
 def get_current_counts(config) -> str:
     """
     """
-    api = Api(config.username, config.password, config.api_path)
+    api = Api(config.username, config.password, config.api_path, cookie_path=config.cookie_path)
 
     with api:
         text = api.get_page_content(PAGE_NAME)
@@ -194,7 +194,7 @@ def save_counts(config: Config, new_counts: dict):
     """
     """
     logger = logging.getLogger(__name__)
-    api = Api(config.username, config.password, config.api_path)
+    api = Api(config.username, config.password, config.api_path, cookie_path=config.cookie_path)
 
     with api:
         text = api.get_page_content(PAGE_NAME)
@@ -0,0 +1,88 @@
+#! /usr/bin/env python3
+
+"""
+Load the current Grand Exchange prices from the Jagex catalogue into the local exchange database.
+
+Use --fixtures DIR to read the catalogue from JSON files instead of requesting it, and --record
+to request any responses missing from DIR and save them there.
+"""
+
+import argparse
+from datetime import datetime
+import logging
+import os
+
+from lib.config import Config
+from lib.rswiki import CatalogueSource, ExchangeCategory, ExchangeIngest, FixtureSource
+from lib.rswiki.exchange_db import ExchangeData
+from lib.util import setup_logging
+
+
+LOG_FILE_FMT = 'ingestexchange-{}.log'
+DB_FILENAME = 'exchange.sqlite'
+
+
+def main():
+    """
+    Program entry point.
+    """
+    args = parse_args()
+    config = Config.from_toml(args.config)
+    setup_logging(args, config, LOG_FILE_FMT)
+    logger = logging.getLogger('ingestexchange')
+
+    if args.fixtures:
+        source = FixtureSource(args.fixtures,
+                               CatalogueSource(delay=args.delay) if args.record else None)
+    else:
+        source = CatalogueSource(delay=args.delay)
+
+    if args.category:
+        categories = [ExchangeCategory.from_id(c) for c in args.category]
+    else:
+        categories = None
+
+    ingest = ExchangeIngest(source, jobs=args.jobs)
+    start = datetime.utcnow()
+
+    with ExchangeData(args.db or os.path.join(config.state_dir, DB_FILENAME)) as data:
+        total = ingest.load(data, categories)
+
+    for category, metrics in sorted(ingest.metrics.items(), key=lambda x: x[0].value):
+        logger.info('%s: %s items from %s requests in %.1fs (%.1f items/s)', category.to_name(),
+                    metrics['items'], metrics['requests'], metrics['seconds'],
+                    metrics['items_per_second'])
+
+    logger.info('Loaded %s items from %s requests (%s failed) in %s', total,
+                source.total_requests, source.error_requests, str(datetime.utcnow() - start))
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Handle command line arguments.
+
+    :return: The found arguments.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--config', required=True)
+    parser.add_argument('--db', required=False)
+    parser.add_argument('--fixtures', required=False)
+    parser.add_argument('--record', action='store_true', default=False)
+    parser.add_argument('--category', type=int, action='append')
+    parser.add_argument('-j', '--jobs', type=int, default=4)
+    parser.add_argument('--delay', type=float, default=0.0)
+
+    group = parser.add_mutually_exclusive_group(required=False)
+    group.add_argument('-v', '--verbose', action='store_true')
+    group.add_argument('-q', '--quiet', action='store_true')
+
+    args = parser.parse_args()
+
+    if args.record and not args.fixtures:
+        parser.error('--record requires --fixtures')
+
+    return args
+
+
+if __name__ == '__main__':
+    main()
@@ -3,17 +3,39 @@
 """
 """
 
+import os
+
 import toml
 
 
 class Config:
-    def __init__(self, log_dir: str, username: str, password: str, api_path: str):
+    def __init__(self, log_dir: str, username: str, password: str, api_path: str,
+                 state_dir: str = None, persist_session: bool = False, cache_dir: str = None,
+                 cache_ttl: int = 3600):
         """
         """
         self.log_dir = log_dir
         self.username = username
         self.password = password
         self.api_path = api_path
+        # defaults to the log directory so existing configs keep working
+        self.state_dir = state_dir if state_dir is not None else log_dir
+        self.persist_session = persist_session
+        self.cache_dir = cache_dir
+        self.cache_ttl = cache_ttl
+
+    @property
+    def cookie_path(self) -> str:
+        """
+        The path to persist the API session cookies to, or ``None`` if sessions should not be
+        persisted between runs.
+
+        :rtype: str
+        """
+        if not self.persist_session:
+            return None
+
+        return os.path.join(self.state_dir, 'cookies-{}.txt'.format(self.username.replace('@', '_')))
 
     @classmethod
     def from_toml(cls, file_path: str):
@@ -26,4 +48,8 @@ class Config:
             return cls(parsed_toml['log_dir'],
                        parsed_toml['username'],
                        parsed_toml['password'],
-                       parsed_toml['api_path'])
+                       parsed_toml['api_path'],
+                       state_dir=parsed_toml.get('state_dir'),
+                       persist_session=parsed_toml.get('persist_session', False),
+                       cache_dir=parsed_toml.get('cache_dir'),
+                       cache_ttl=parsed_toml.get('cache_ttl', 3600))
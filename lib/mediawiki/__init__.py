@@ -4,3 +4,6 @@
 """
 
 from .api import Api
+from .cache import ResponseCache
+from .edit_queue import EditQueue
+from .revision_store import RevisionStore, OfflineApi
@@ -3,24 +3,38 @@
 """
 """
 
-from json.decoder import JSONDecodeError
+from http.cookiejar import LoadError, LWPCookieJar
 import logging
+import os
 from pprint import pprint
 
 import requests
 
-from ..exception import MediaWikiError, LoginError, EditError, ApiError
+# optional, allows revisions to be decoded as they are downloaded
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
+
+from ..exception import MediaWikiError, LoginError, EditError, APIError
+from ..util import json_loads
 
 
 LOGGER = logging.getLogger(__name__)
 
+# session cookies shared between ``Api`` instances in the same process
+# keyed by (api_path, username)
+_SESSIONS = {}
+
 
 class Api:
     """
     A class to be used to interact with a single MediaWiki instance.
     """
 
-    def __init__(self, username: str, password: str, api_path: str):
+    def __init__(self, username: str, password: str, api_path: str, cookie_path: str = None,
+                 cache=None):
         """
         Create a new instance of ``Api``.
 
@@ -31,10 +45,16 @@ class Api:
             documentation for more details.
         :param str api_path: A string representing the MediaWiki instance to interact with.
             Should contain the protocol, e.g. ``https://`` and the API endpoint, e.g. ``/api.php``.
+        :param str cookie_path: An optional path to persist the session cookies to. If provided,
+            the session is kept alive when exiting the context manager instead of logging out and
+            is reused by later instances, either in the same process or in a later run.
+        :param ResponseCache cache: An optional cache to check before making read-only queries.
         """
         self.username = username
         self.password = password
         self.api_path = api_path
+        self.cookie_path = cookie_path
+        self.cache = cache
 
         self.session = requests.Session()
         self.assert_param = None
@@ -54,15 +74,24 @@ class Api:
                 # logged in
 
             # logged out
+
+        If ``cookie_path`` was set, a previously saved session is tried first and only if it is
+        no longer valid will a new login be performed.
         """
+        if self.cookie_path is not None and not self.is_wikia and self.resume_session():
+            return
+
         self.login()
 
     def __exit__(self, err_type, err_val, err_tb):
         """
         """
-        self.logout()
+        if self.cookie_path is not None and not self.is_wikia:
+            self.save_session()
+        else:
+            self.logout()
 
-    def __call(self, **kwargs) -> dict:
+    def __request(self, kwargs: dict, stream: bool = False) -> requests.Response:
         """
         """
         is_get = kwargs['action'] in ('query',)
@@ -72,15 +101,34 @@ class Api:
             kwargs['assert'] = self.assert_param
 
         req = getattr(self.session, 'get' if is_get else 'post')
-        res = req(self.api_path, **{'params' if is_get else 'data': kwargs})
+        res = req(self.api_path, stream=stream, **{'params' if is_get else 'data': kwargs})
 
         # only log get requests to avoid logging sensitive data
         if is_get:
             LOGGER.debug('Requested: %s', res.url)
 
+        return res
+
+    def __call(self, cached: bool = True, **kwargs) -> dict:
+        """
+        """
+        use_cache = cached and self.cache is not None and self.cache.is_cacheable(kwargs)
+
+        if use_cache:
+            # copy the parameters before the request adds format and assert to them
+            cache_params = dict(kwargs)
+            ret = self.cache.get(cache_params)
+
+            if ret is not None:
+                LOGGER.debug('Cache hit: %s', cache_params)
+                return ret
+
+        res = self.__request(kwargs)
+
         try:
-            ret = res.json()
-        except JSONDecodeError as exc:
+            # decode from bytes so the body isn't held as text as well
+            ret = json_loads(res.content)
+        except ValueError as exc:
             LOGGER.exception(exc)
             raise MediaWikiError('Unable to decode response: {!r}'.format(res.text)) from exc
 
@@ -88,6 +136,146 @@ class Api:
         if 'error' in ret:
             raise APIError(**ret['error'])
 
+        if use_cache:
+            self.cache.set(cache_params, res.content)
+
+        return ret
+
+    def __stream_revisions(self, kwargs: dict):
+        """
+        Decode a ``prop=revisions`` response as it is downloaded, yielding each revision as soon
+        as it has been read.
+
+        :return dict: The continue parameters, or ``None`` if there are no more results.
+        """
+        res = self.__request(kwargs, stream=True)
+        res.raw.decode_content = True
+        cont = None
+        builder = None
+        builder_prefix = None
+
+        try:
+            for prefix, event, value in ijson.parse(res.raw):
+                if builder is not None:
+                    builder.event(event, value)
+
+                    if prefix == builder_prefix and event == 'end_map':
+                        if builder_prefix == 'error':
+                            raise APIError(**builder.value)
+
+                        elif builder_prefix == 'continue':
+                            cont = builder.value
+
+                        elif builder_prefix == 'query-continue':
+                            cont = list(builder.value.values())[0]
+
+                        else:
+                            yield builder.value
+
+                        builder = None
+
+                    continue
+
+                if event != 'start_map':
+                    continue
+
+                # revisions are found at query.pages.<pageid>.revisions.item
+                parts = prefix.split('.')
+                is_revision = (len(parts) == 5 and parts[:2] == ['query', 'pages'] and
+                               parts[3:] == ['revisions', 'item'])
+
+                if is_revision or prefix in ('error', 'continue', 'query-continue'):
+                    builder = ObjectBuilder()
+                    builder.event(event, value)
+                    builder_prefix = prefix
+
+        except ijson.JSONError as exc:
+            LOGGER.exception(exc)
+            raise MediaWikiError('Unable to decode response from: {!r}'.format(res.url)) from exc
+
+        finally:
+            res.close()
+
+        return cont
+
+    def __cached_revisions(self, kwargs: dict):
+        """
+        Get a batch of revisions, taking their content from the cache where it can.
+
+        The batch is requested without content and isn't cached, as every edit to the page shifts
+        the batches. The content of the revisions that aren't cached is then requested by
+        revision ID, 50 at a time, and cached by revision ID, which never changes.
+
+        :return dict: The continue parameters, or ``None`` if there are no more results.
+        """
+        props = [p for p in str(kwargs['rvprop']).split('|') if p != 'content']
+
+        if 'ids' not in props:
+            props.append('ids')
+
+        kwargs['rvprop'] = '|'.join(props)
+        res = self.__call(cached=False, **kwargs)
+
+        if 'continue' in res:
+            cont = res['continue']
+        elif 'query-continue' in res:
+            cont = list(res['query-continue'].values())[0]
+        else:
+            cont = None
+
+        for page in res.get('query', {}).get('pages', {}).values():
+            revisions = page.get('revisions', [])
+
+            for i in range(0, len(revisions), 50):
+                batch = revisions[i:i + 50]
+                contents = {}
+
+                for revision in batch:
+                    content = self.cache.get_revision(revision['revid'])
+
+                    if content is not None:
+                        contents[revision['revid']] = content
+
+                missing = [r['revid'] for r in batch if r['revid'] not in contents]
+
+                if missing:
+                    contents.update(self.__request_contents(missing))
+
+                for revision in batch:
+                    revision.update(contents.get(revision['revid'], {}))
+                    yield revision
+
+        return cont
+
+    def __request_contents(self, revision_ids: list) -> dict:
+        """
+        Request the content of many revisions and add it to the cache.
+
+        :return dict: The content of each revision, keyed by revision ID.
+        """
+        params = {'action': 'query',
+                  'prop': 'revisions',
+                  'rvprop': 'ids|content',
+                  'revids': '|'.join(str(r) for r in revision_ids)}
+        ret = {}
+
+        while True:
+            res = self.__call(cached=False, **params)
+
+            for page in res.get('query', {}).get('pages', {}).values():
+                for revision in page.get('revisions', []):
+                    content = {k: v for k, v in revision.items() if k not in ('revid', 'parentid')}
+
+                    # content that didn't fit in this response is continued
+                    if '*' in content or 'texthidden' in content:
+                        self.cache.set_revision(revision['revid'], content)
+                        ret[revision['revid']] = content
+
+            if 'continue' not in res:
+                break
+
+            params.update(res['continue'])
+
         return ret
 
     def get_token(self, token = 'csrf', is_wikia: bool = False):
@@ -179,6 +367,76 @@ class Api:
         LOGGER.debug('Logging out of %r as %r', self.api_path, self.username)
         self.__call(action='logout')
         self.assert_param = None
+        _SESSIONS.pop((self.api_path, self.username), None)
+
+    def resume_session(self) -> bool:
+        """
+        Attempt to reuse a saved session rather than logging in again.
+
+        Cookies are taken from another instance in the same process if available, otherwise from
+        ``cookie_path``. The session is then checked with a single ``assert=user`` request.
+
+        :return bool: ``True`` if the saved session is still logged in, ``False`` otherwise.
+        """
+        key = (self.api_path, self.username)
+
+        if key in _SESSIONS:
+            self.session.cookies.update(_SESSIONS[key])
+
+        elif os.path.exists(self.cookie_path):
+            jar = LWPCookieJar(self.cookie_path)
+
+            try:
+                jar.load(ignore_discard=True, ignore_expires=True)
+            except (OSError, LoadError) as exc:
+                LOGGER.warning('Unable to load saved session from %r: %s', self.cookie_path, exc)
+                return False
+
+            self.session.cookies.update(jar)
+
+        else:
+            return False
+
+        try:
+            self.__call(action='query', meta='userinfo', **{'assert': 'user'})
+        except APIError as exc:
+            LOGGER.debug('Saved session for %r is no longer valid: %s', self.username, exc.code)
+            self.session.cookies.clear()
+            _SESSIONS.pop(key, None)
+            return False
+
+        LOGGER.debug('Resumed session on %r as %r', self.api_path, self.username)
+        self.assert_param = 'user'
+        return True
+
+    def save_session(self):
+        """
+        Save the session cookies to ``cookie_path`` and for reuse by other instances in the same
+        process. The session is not logged out.
+        """
+        LOGGER.debug('Saving session on %r as %r', self.api_path, self.username)
+        _SESSIONS[(self.api_path, self.username)] = self.session.cookies.copy()
+
+        jar = LWPCookieJar(self.cookie_path)
+
+        for cookie in self.session.cookies:
+            jar.set_cookie(cookie)
+
+        # state_dir may not exist yet on the first run
+        os.makedirs(os.path.dirname(os.path.abspath(self.cookie_path)), exist_ok=True)
+        tmp_path = self.cookie_path + '.tmp'
+
+        # the cookies are as good as the password, so the file is never readable by anyone else,
+        # equivalent to jar.save
+        fd = os.open(tmp_path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600)
+        os.fchmod(fd, 0o600)
+
+        with os.fdopen(fd, 'w') as fh:
+            fh.write('#LWP-Cookies-2.0\n')
+            fh.write(jar.as_lwp_str(ignore_discard=True, ignore_expires=True))
+
+        os.replace(tmp_path, self.cookie_path)
+        self.assert_param = None
 
     def __find_result(self, result: dict, path: str = None):
         """
@@ -248,6 +506,60 @@ class Api:
 
             yield from self.iterator(**kwargs)
 
+    def iter_revisions(self, **kwargs):
+        """
+        Generator for the revisions of a single page, i.e. ``prop=revisions``.
+
+        This is equivalent to ``iterator(path='revisions', prop='revisions', ...)`` but avoids
+        holding each batch of revisions in memory as both the response body and the decoded
+        result, which matters for ``rvprop=content`` on pages with long histories. If ``ijson``
+        is installed each revision is yielded as soon as it has been downloaded. Otherwise the
+        batch is decoded in one go and each revision is released after it has been yielded.
+
+        If responses are being cached the content of each revision is cached by its ID, see
+        ``__cached_revisions``.
+
+        :param **kwargs: Key-value arguments representing the parameters to be passed to the API
+            call. ``action=query`` and ``prop=revisions`` are set automatically.
+        """
+        kwargs.pop('path', None)
+        kwargs['action'] = 'query'
+        kwargs['prop'] = 'revisions'
+
+        with_content = 'content' in str(kwargs.get('rvprop', '')).split('|')
+
+        while True:
+            if self.cache is not None and with_content:
+                cont = yield from self.__cached_revisions(dict(kwargs))
+
+            elif ijson is not None and self.cache is None:
+                cont = yield from self.__stream_revisions(dict(kwargs))
+
+            else:
+                res = self.__call(**dict(kwargs))
+                pages = res.get('query', {}).get('pages', {})
+
+                if 'continue' in res:
+                    cont = res['continue']
+                elif 'query-continue' in res:
+                    cont = list(res['query-continue'].values())[0]
+                else:
+                    cont = None
+
+                del res
+
+                for page in pages.values():
+                    revisions = page.get('revisions', [])
+                    revisions.reverse()
+
+                    while revisions:
+                        yield revisions.pop()
+
+            if cont is None:
+                break
+
+            kwargs.update(cont)
+
     def get_page_content(self, pagename: str) -> str:
         """
         """
@@ -266,6 +578,76 @@ class Api:
 
         return res['*']
 
+    def get_pages_content(self, titles, batch_size: int = 50) -> dict:
+        """
+        Get the current content of many pages, requesting ``batch_size`` pages at a time rather
+        than one page per request.
+
+        :param titles: An iterable of page titles.
+        :param int batch_size: The number of pages to request at once. The API allows up to 50
+            when requesting content, or 500 for bots.
+
+        :return dict: A dictionary mapping each title to its content, or ``None`` if the page
+            does not exist. Titles are the same as those given, even if the API normalised them.
+        """
+        return {title: rev['content']
+                for title, rev in self.get_pages_revision(titles, batch_size).items()}
+
+    def get_pages_revision(self, titles, batch_size: int = 50) -> dict:
+        """
+        Get the current revision of many pages, in the same way as ``get_pages_content``, along
+        with the timestamps needed to detect edit conflicts when editing them.
+
+        :param titles: An iterable of page titles.
+        :param int batch_size: The number of pages to request at once.
+
+        :return dict: A dictionary mapping each title to a dictionary of ``content``, the content
+            of the current revision, ``timestamp``, the timestamp of the current revision, and
+            ``starttimestamp``, the time the revision was requested. ``content`` and ``timestamp``
+            are ``None`` if the page does not exist. These can be passed to ``edit_page``.
+        """
+        titles = list(titles)
+        ret = {}
+
+        for i in range(0, len(titles), batch_size):
+            batch = titles[i:i + batch_size]
+            LOGGER.debug('Requesting page content of %s pages', len(batch))
+            params = {'action': 'query',
+                      'prop': 'revisions',
+                      'titles': '|'.join(batch),
+                      'rvprop': 'content|timestamp',
+                      'curtimestamp': 1}
+            start = None
+
+            while True:
+                # the current timestamp must be fresh to be used as the start of an edit
+                res = self.__call(cached=False, **params)
+                query = res.get('query', {})
+                # continued responses are later, so use the time the batch was first requested
+                start = start or res.get('curtimestamp')
+                # map normalised titles back to the titles that were requested
+                names = {n['to']: n['from'] for n in query.get('normalized', [])}
+
+                for page in query.get('pages', {}).values():
+                    title = names.get(page['title'], page['title'])
+
+                    if 'missing' in page or 'invalid' in page:
+                        ret[title] = {'content': None, 'timestamp': None,
+                                      'starttimestamp': start}
+                    elif page.get('revisions'):
+                        rev = page['revisions'][0]
+                        ret[title] = {'content': rev['*'], 'timestamp': rev['timestamp'],
+                                      'starttimestamp': start}
+
+                    # otherwise the content didn't fit in this response and is continued
+
+                if 'continue' not in res:
+                    break
+
+                params.update(res['continue'])
+
+        return ret
+
     def get_revision(self, revision_id: int) -> dict:
         """
         """
@@ -276,16 +658,47 @@ class Api:
                           revids=revision_id)
         return self.__find_result(res)
 
-    def edit_page(self, pagename: str, text: str, summary: str = ''):
+    def edit_page(self, pagename: str, text: str, summary: str = '', token: str = None,
+                  basetimestamp: str = None, starttimestamp: str = None, nocreate: bool = False,
+                  createonly: bool = False):
         """
+        Replace the content of a page.
+
+        :param str pagename: The title of the page.
+        :param str text: The new content of the page.
+        :param str summary: The edit summary.
+        :param str token: An optional CSRF token to use, which saves requesting a new token for
+            every edit.
+        :param str basetimestamp: The timestamp of the revision the new content is based on. If
+            the page has been edited since, the edit fails with an ``editconflict`` error.
+        :param str starttimestamp: The time the base revision was requested. If the page has been
+            deleted since, the edit fails with a ``pagedeleted`` error.
+        :param bool nocreate: Fail with a ``missingtitle`` error if the page does not exist.
+        :param bool createonly: Fail with an ``articleexists`` error if the page already exists.
         """
-        token = self.get_token()
+        if token is None:
+            token = self.get_token()
+
+        params = {}
+
+        if basetimestamp is not None:
+            params['basetimestamp'] = basetimestamp
+
+        if starttimestamp is not None:
+            params['starttimestamp'] = starttimestamp
+
+        if nocreate:
+            params['nocreate'] = 1
+
+        if createonly:
+            params['createonly'] = 1
 
         res = self.__call(action='edit',
                           title=pagename,
                           summary=summary,
                           text=text,
-                          token=token)
+                          token=token,
+                          **params)
 
         try:
             if res['edit']['result'] != 'Success':
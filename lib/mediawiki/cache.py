@@ -0,0 +1,191 @@
+#
+
+"""
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+from time import time
+
+from ..util import json_dumps, json_loads
+
+
+__all__ = ['ResponseCache']
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    An on-disk cache of responses to read-only ``action=query`` requests.
+
+    Responses are stored by a hash of the request parameters. Revisions can't be changed once
+    they've been saved, so responses to requests for specific revisions never expire. Responses to
+    other requests expire after ``ttl`` seconds.
+
+    The content of single revisions can also be stored by revision ID, see ``get_revision``, as
+    used by ``Api.iter_revisions``. A page's history is requested in batches that shift every time
+    the page is edited, so caching the batches would miss every time and leave the old ones behind.
+    """
+
+    # parameters that don't change the content of the response
+    _IGNORED_PARAMS = ('format', 'assert')
+    # lists that are used to find what has changed, so a stale response would miss changes
+    _VOLATILE_LISTS = ('recentchanges', 'logevents', 'watchlist', 'watchlistraw', 'usercontribs')
+
+    def __init__(self, path: str, ttl: int = 3600):
+        """
+        Create a new instance of ``ResponseCache``.
+
+        :param str path: The directory to store responses in. Created if it does not exist.
+        :param int ttl: The number of seconds responses to requests that aren't for specific
+            revisions are valid for. If ``0`` they are never used.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def is_cacheable(params: dict) -> bool:
+        """
+        Check if the response to a request can be cached.
+
+        Only queries for page data are cached. Anything using ``meta``, e.g. tokens or user
+        information, is tied to the current session so never cached. Lists used to find
+        changes, e.g. ``list=recentchanges``, are never cached either.
+
+        :param dict params: The request parameters.
+
+        :rtype: bool
+        """
+        if params.get('action') != 'query' or 'meta' in params:
+            return False
+
+        if 'list' in params:
+            lists = str(params['list']).split('|')
+
+            return not any(name in ResponseCache._VOLATILE_LISTS for name in lists)
+
+        return 'prop' in params
+
+    @staticmethod
+    def is_immutable(params: dict) -> bool:
+        """
+        Check if the response to a request will never change.
+
+        This is only the case for requests for specific revisions.
+
+        :param dict params: The request parameters.
+
+        :rtype: bool
+        """
+        return 'revids' in params
+
+    def key(self, params: dict) -> str:
+        """
+        Get the cache key for a request.
+
+        :param dict params: The request parameters.
+
+        :rtype: str
+        """
+        items = sorted((k, str(v)) for k, v in params.items() if k not in self._IGNORED_PARAMS)
+        return hashlib.sha256(json_dumps(items)).hexdigest()
+
+    def __file_path(self, key: str) -> str:
+        """
+        """
+        return os.path.join(self.path, key[:2], key + '.json')
+
+    def get(self, params: dict) -> dict:
+        """
+        Get the cached response for a request.
+
+        :param dict params: The request parameters.
+
+        :return dict: The decoded response, or ``None`` if it isn't cached or has expired.
+        """
+        file_path = self.__file_path(self.key(params))
+
+        try:
+            modified = os.path.getmtime(file_path)
+
+            if not self.is_immutable(params) and time() - modified >= self.ttl:
+                self.misses += 1
+                return None
+
+            with open(file_path, 'rb') as fh:
+                content = fh.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        try:
+            ret = json_loads(content)
+        except ValueError:
+            LOGGER.warning('Ignoring corrupt cache entry: %s', file_path)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return ret
+
+    def get_revision(self, revision_id: int) -> dict:
+        """
+        Get the cached content of a revision.
+
+        :param int revision_id: The ID of the revision.
+
+        :return dict: The content of the revision as stored by ``set_revision``, or ``None`` if it
+            isn't cached.
+        """
+        return self.get(self.__revision_params(revision_id))
+
+    def set_revision(self, revision_id: int, content: dict):
+        """
+        Store the content of a revision. It never expires.
+
+        :param int revision_id: The ID of the revision.
+        :param dict content: The content of the revision, e.g. ``{'*': '...', ...}``.
+        """
+        self.set(self.__revision_params(revision_id), json_dumps(content))
+
+    @staticmethod
+    def __revision_params(revision_id: int) -> dict:
+        """
+        """
+        # the request that would get the content, so it's immutable
+        return {'action': 'query', 'prop': 'revisions', 'rvprop': 'content',
+                'revids': int(revision_id)}
+
+    def set(self, params: dict, content: bytes):
+        """
+        Store the response for a request.
+
+        :param dict params: The request parameters.
+        :param bytes content: The raw response body.
+        """
+        if self.ttl <= 0 and not self.is_immutable(params):
+            # it would never be used
+            return
+
+        file_path = self.__file_path(self.key(params))
+        dirname = os.path.dirname(file_path)
+        os.makedirs(dirname, exist_ok=True)
+
+        # write to a temporary file first so a partial response is never read
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(content)
+
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
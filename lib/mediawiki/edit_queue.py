@@ -0,0 +1,216 @@
+#
+
+"""
+"""
+
+import logging
+import os
+import time
+
+from ..exception import MediaWikiError, APIError
+from ..util import json_dumps, json_loads
+
+
+__all__ = ['EditQueue']
+
+LOGGER = logging.getLogger(__name__)
+
+# errors that mean the edit should be tried again later rather than given up on
+_RETRY_CODES = ('ratelimited', 'maxlag', 'readonly')
+# errors that mean the page changed after the edit was queued, so the edit is out of date
+_CONFLICT_CODES = ('editconflict', 'pagedeleted', 'missingtitle', 'articleexists')
+
+
+class EditQueue:
+    """
+    A queue of edits that is saved to disk so an interrupted run can be resumed.
+
+    Edits are made in the order they were added, waiting at least ``interval`` seconds between
+    each one. Edits that are rate limited by the wiki are retried after a backoff. Edits that
+    fail for any other reason are logged and recorded in ``failed`` rather than stopping the
+    queue.
+
+    Each edit is made against the revision it was based on, so if the page was edited, deleted or
+    created by someone else after the edit was queued, the edit is skipped and recorded in
+    ``failed`` rather than overwriting their change. Pages are only created by edits added with
+    ``create``.
+
+    The queue is saved every ``save_every`` edits and when ``run`` returns or is interrupted, so
+    at most ``save_every`` edits are repeated when resuming. Repeating an edit doesn't change the
+    page, so this is harmless.
+
+    Example::
+
+        queue = EditQueue('edits.json')
+
+        if not queue:
+            queue.add('Module:Exchange/Fire rune', text, 'Update price')
+            queue.save()
+
+        with api:
+            queue.run(api)
+    """
+
+    def __init__(self, path: str, interval: float = 1.0, max_retries: int = 5,
+                 backoff: float = 30.0, save_every: int = 10):
+        """
+        Create a new instance of ``EditQueue``, loading any edits saved by a previous run.
+
+        :param str path: The file to save the queue to.
+        :param float interval: The minimum number of seconds between edits.
+        :param int max_retries: The number of times to retry an edit that was rate limited.
+        :param float backoff: The number of seconds to wait before the first retry. This is
+            doubled for each following retry.
+        :param int save_every: The number of edits to make between saving the queue.
+        """
+        self.path = path
+        self.interval = interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.save_every = save_every
+
+        self.pending = []
+        self.failed = []
+
+        try:
+            with open(path, 'rb') as fh:
+                state = json_loads(fh.read())
+        except FileNotFoundError:
+            pass
+        else:
+            self.pending = [_pad_edit(e) for e in state.get('pending', [])]
+            self.failed = [tuple(e) for e in state.get('failed', [])]
+            LOGGER.debug('Loaded %s pending edits from %s', len(self.pending), path)
+
+    def __len__(self) -> int:
+        """
+        """
+        return len(self.pending)
+
+    def add(self, title: str, text: str, summary: str = '', basetimestamp: str = None,
+            starttimestamp: str = None, create: bool = False):
+        """
+        Add an edit to the end of the queue. The queue isn't saved until ``save`` or ``run`` is
+        called.
+
+        :param str title: The title of the page to edit.
+        :param str text: The new content of the page.
+        :param str summary: The edit summary.
+        :param str basetimestamp: The timestamp of the revision ``text`` is based on, see
+            ``Api.get_pages_revision``.
+        :param str starttimestamp: The time the base revision was requested.
+        :param bool create: ``True`` if the page didn't exist and should be created, otherwise the
+            page must exist.
+        """
+        self.pending.append((title, text, summary, basetimestamp, starttimestamp, create))
+
+    def clear(self):
+        """
+        Remove every pending and failed edit.
+        """
+        self.pending = []
+        self.failed = []
+
+    def save(self):
+        """
+        Save the pending and failed edits to ``path``.
+        """
+        tmp_path = self.path + '.tmp'
+
+        with open(tmp_path, 'wb') as fh:
+            fh.write(json_dumps({'pending': self.pending, 'failed': self.failed}))
+
+        os.replace(tmp_path, self.path)
+
+    def run(self, api, limit: int = None) -> int:
+        """
+        Make the pending edits.
+
+        :param Api api: The API to edit with. Must already be logged in.
+        :param int limit: The maximum number of edits to make, if any.
+
+        :return int: The number of edits made.
+        """
+        token = None
+        last_edit = None
+        made = 0
+        processed = 0
+
+        try:
+            while self.pending and (limit is None or made < limit):
+                title, text, summary, basetimestamp, starttimestamp, create = self.pending[0]
+
+                if last_edit is not None:
+                    wait = self.interval - (time.monotonic() - last_edit)
+
+                    if wait > 0:
+                        time.sleep(wait)
+
+                if token is None:
+                    token = api.get_token()
+
+                retries = 0
+
+                while True:
+                    last_edit = time.monotonic()
+
+                    try:
+                        api.edit_page(title, text, summary, token=token,
+                                      basetimestamp=basetimestamp, starttimestamp=starttimestamp,
+                                      nocreate=not create, createonly=create)
+
+                    except APIError as exc:
+                        if exc.code == 'badtoken' and retries == 0:
+                            token = api.get_token()
+                            retries += 1
+                            continue
+
+                        if exc.code in _RETRY_CODES and retries < self.max_retries:
+                            wait = self.backoff * 2 ** retries
+                            LOGGER.warning('Edit to %s failed with %s, retrying in %ss', title,
+                                           exc.code, wait)
+                            time.sleep(wait)
+                            retries += 1
+                            continue
+
+                        if exc.code in _CONFLICT_CODES:
+                            LOGGER.warning('Skipping edit to %s as the page changed after it was '
+                                           'queued: %s', title, exc.code)
+                            self.failed.append((title, str(exc)))
+                        else:
+                            self.__fail(title, exc)
+
+                    except MediaWikiError as exc:
+                        self.__fail(title, exc)
+
+                    else:
+                        LOGGER.debug('Edited %s', title)
+                        made += 1
+
+                    break
+
+                self.pending.pop(0)
+                processed += 1
+
+                if processed % self.save_every == 0:
+                    self.save()
+
+        finally:
+            self.save()
+
+        return made
+
+    def __fail(self, title: str, exc: Exception):
+        """
+        """
+        LOGGER.error('Unable to edit %s: %s', title, exc)
+        self.failed.append((title, str(exc)))
+
+
+def _pad_edit(edit) -> tuple:
+    """
+    Convert an edit loaded from a saved queue to a tuple, filling in the fields missing from edits
+    saved before they were added. Those edits are made without checking for conflicts and never
+    create the page.
+    """
+    return (tuple(edit) + (None, None, False))[:6]
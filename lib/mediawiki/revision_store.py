@@ -0,0 +1,310 @@
+#
+
+"""
+"""
+
+import logging
+import sqlite3
+import zlib
+
+
+__all__ = ['RevisionStore', 'OfflineApi']
+
+LOGGER = logging.getLogger(__name__)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pages (
+    pageid INTEGER PRIMARY KEY,
+    ns INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    last_revid INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS pages_ns_title ON pages (ns, title);
+CREATE TABLE IF NOT EXISTS revisions (
+    revid INTEGER PRIMARY KEY,
+    pageid INTEGER NOT NULL REFERENCES pages (pageid),
+    parentid INTEGER,
+    timestamp TEXT NOT NULL,
+    user TEXT,
+    userid INTEGER,
+    comment TEXT,
+    content BLOB
+);
+CREATE INDEX IF NOT EXISTS revisions_pageid_revid ON revisions (pageid, revid);
+'''
+_RVPROP = 'ids|timestamp|user|userid|comment|content'
+# the number of revisions to insert at once
+_BATCH_SIZE = 500
+
+
+class RevisionStore:
+    """
+    A local archive of page histories.
+
+    Revisions are stored in a sqlite database with their content compressed using zlib. The
+    highest revision ID stored for each page is kept so that syncing a page only requests
+    revisions that have been made since the previous sync.
+    """
+
+    def __init__(self, path: str):
+        """
+        Create a new instance of ``RevisionStore``.
+
+        :param str path: The path to the sqlite database. Created if it does not exist.
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        """
+        Close the underlying database connection.
+        """
+        self.conn.close()
+
+    def sync_page(self, api, page: dict) -> int:
+        """
+        Fetch any revisions of a page that are newer than those already stored.
+
+        :param Api api: The API to fetch revisions from.
+        :param dict page: The page to sync, as returned by ``list=allpages``, i.e. containing
+            ``pageid``, ``ns`` and ``title``.
+
+        :return int: The number of revisions added.
+        """
+        row = self.conn.execute('SELECT last_revid FROM pages WHERE pageid = ?',
+                                (page['pageid'],)).fetchone()
+        last_revid = row['last_revid'] if row is not None else 0
+
+        # keep the title up to date in case the page was moved
+        with self.conn:
+            self.conn.execute('INSERT INTO pages (pageid, ns, title) VALUES (?, ?, ?) '
+                              'ON CONFLICT (pageid) DO UPDATE SET ns = excluded.ns, '
+                              'title = excluded.title',
+                              (page['pageid'], page['ns'], page['title']))
+
+        params = {'titles': page['title'],
+                  'rvprop': _RVPROP,
+                  'rvlimit': 'max',
+                  'rvdir': 'newer'}
+
+        if last_revid:
+            # rvstartid has to be a revision of the page, so start from the last one stored
+            params['rvstartid'] = last_revid
+
+        total = 0
+        batch = []
+
+        for revision in api.iter_revisions(**params):
+            if revision['revid'] == last_revid:
+                continue
+
+            batch.append(revision)
+
+            if len(batch) >= _BATCH_SIZE:
+                total += self.__insert(page['pageid'], batch)
+                batch = []
+
+        if batch:
+            total += self.__insert(page['pageid'], batch)
+
+        LOGGER.debug('Synced %s revisions of %s', total, page['title'])
+        return total
+
+    def sync(self, api, namespace: int, prefix: str = None, start: str = None) -> int:
+        """
+        Sync every page in a namespace.
+
+        :param Api api: The API to fetch pages and revisions from.
+        :param int namespace: The namespace to sync.
+        :param str prefix: An optional prefix the page titles must start with, excluding the
+            namespace.
+        :param str start: An optional page title to start from, excluding the namespace.
+
+        :return int: The number of revisions added.
+        """
+        params = {'list': 'allpages', 'apnamespace': namespace, 'aplimit': 'max'}
+
+        if prefix is not None:
+            params['apprefix'] = prefix
+
+        if start is not None:
+            params['apfrom'] = start
+
+        total = 0
+
+        for page in api.iterator(**params):
+            added = self.sync_page(api, page)
+
+            if added:
+                LOGGER.info('Added %s revisions of %s', added, page['title'])
+
+            total += added
+
+        return total
+
+    def __insert(self, pageid: int, revisions: list) -> int:
+        """
+        """
+        rows = []
+
+        for rev in revisions:
+            content = rev.get('*')
+
+            if content is not None:
+                content = zlib.compress(content.encode('utf-8'))
+
+            rows.append((rev['revid'], pageid, rev.get('parentid'), rev['timestamp'],
+                         rev.get('user'), rev.get('userid'), rev.get('comment'), content))
+
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO revisions VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                  rows)
+            self.conn.execute('UPDATE pages SET last_revid = MAX(last_revid, ?) WHERE pageid = ?',
+                              (max(r[0] for r in rows), pageid))
+
+        return len(rows)
+
+    def pages(self, namespace: int, prefix: str = None, start: str = None):
+        """
+        Generator for the pages stored for a namespace, in the same form and order as
+        ``list=allpages``.
+
+        :param int namespace: The namespace to list.
+        :param str prefix: An optional prefix the page titles must start with, excluding the
+            namespace.
+        :param str start: An optional page title to start from, excluding the namespace.
+        """
+        for row in self.conn.execute('SELECT pageid, ns, title FROM pages WHERE ns = ? '
+                                     'ORDER BY title', (namespace,)):
+            # titles are stored with their namespace, but the filters don't include it
+            name = row['title'].split(':', 1)[-1]
+
+            if prefix is not None and not name.startswith(prefix):
+                continue
+
+            if start is not None and name < start:
+                continue
+
+            yield {'pageid': row['pageid'], 'ns': row['ns'], 'title': row['title']}
+
+    def revisions(self, title: str, newer: bool = False):
+        """
+        Generator for the stored revisions of a page, in the same form as ``prop=revisions``.
+
+        :param str title: The title of the page.
+        :param bool newer: If ``True`` yield the oldest revision first, otherwise yield the
+            newest first like the API does by default.
+        """
+        order = 'ASC' if newer else 'DESC'
+        cursor = self.conn.execute('SELECT r.* FROM revisions r JOIN pages p USING (pageid) '
+                                   'WHERE p.title = ? ORDER BY r.revid ' + order, (title,))
+
+        for row in cursor:
+            yield self.__to_revision(row)
+
+    def revision(self, revid: int) -> dict:
+        """
+        Get a single revision along with the page it belongs to.
+
+        :param int revid: The revision ID.
+
+        :return dict: The page, in the same form as ``prop=revisions&revids=...``, or ``None`` if
+            the revision is not stored.
+        """
+        row = self.conn.execute('SELECT r.*, p.ns, p.title FROM revisions r '
+                                'JOIN pages p USING (pageid) WHERE r.revid = ?',
+                                (revid,)).fetchone()
+
+        if row is None:
+            return None
+
+        return {'pageid': row['pageid'],
+                'ns': row['ns'],
+                'title': row['title'],
+                'revisions': [self.__to_revision(row)]}
+
+    @staticmethod
+    def __to_revision(row: sqlite3.Row) -> dict:
+        """
+        """
+        ret = {'revid': row['revid'],
+               'parentid': row['parentid'],
+               'timestamp': row['timestamp'],
+               'user': row['user'],
+               'userid': row['userid'],
+               'comment': row['comment']}
+
+        if row['content'] is not None:
+            ret['*'] = zlib.decompress(row['content']).decode('utf-8')
+
+        return ret
+
+
+class OfflineApi:
+    """
+    A read-only stand in for ``Api`` backed by a ``RevisionStore``.
+
+    This supports the subset of ``Api`` used to read page histories, i.e. ``list=allpages`` and
+    ``prop=revisions`` queries, so scripts can be run without access to the wiki.
+    """
+
+    def __init__(self, store: RevisionStore):
+        """
+        Create a new instance of ``OfflineApi``.
+
+        :param RevisionStore store: The store to read from.
+        """
+        self.store = store
+
+    def __enter__(self):
+        """
+        """
+        pass
+
+    def __exit__(self, err_type, err_val, err_tb):
+        """
+        """
+        pass
+
+    def iterator(self, path: str = None, **kwargs):
+        """
+        Equivalent of ``Api.iterator`` for ``list=allpages`` and ``prop=revisions`` queries.
+
+        :raises NotImplementedError: If any other query is requested.
+        """
+        if kwargs.get('list') == 'allpages':
+            yield from self.store.pages(int(kwargs.get('apnamespace', 0)),
+                                        kwargs.get('apprefix'),
+                                        kwargs.get('apfrom'))
+
+        elif kwargs.get('prop') == 'revisions' and 'titles' in kwargs:
+            yield from self.iter_revisions(**kwargs)
+
+        else:
+            raise NotImplementedError('Unsupported offline query: {!r}'.format(kwargs))
+
+    def iter_revisions(self, **kwargs):
+        """
+        Equivalent of ``Api.iter_revisions``.
+        """
+        yield from self.store.revisions(kwargs['titles'], kwargs.get('rvdir') == 'newer')
+
+    def get_page_content(self, pagename: str) -> str:
+        """
+        """
+        for revision in self.store.revisions(pagename):
+            return revision['*']
+
+        raise KeyError(pagename)
+
+    def get_revision(self, revision_id: int) -> dict:
+        """
+        """
+        ret = self.store.revision(int(revision_id))
+
+        if ret is None:
+            raise KeyError(revision_id)
+
+        return ret
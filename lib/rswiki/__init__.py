@@ -1,3 +1,7 @@
 # Copyright (C) 2018 Matthew Dowdell <mdowdell244@gmail.com>
 
 from .exchange_item import *
+from .exchange_export import *
+from .exchange_ingest import *
+from .exchange_module_parser import *
+from .exchange_record import *
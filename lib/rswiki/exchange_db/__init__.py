@@ -0,0 +1,10 @@
+#
+
+"""
+A local store of exchange items and their price history.
+"""
+
+from .exchange_data import ExchangeData
+from .exchange_item import ITEMS_SCHEMA, ITEM_COLUMNS, item_to_row, row_to_item
+from .exchange_item_history import PRICE_HISTORY_SCHEMA, PRICE_HISTORY_COLUMNS, \
+    item_to_history_row, ExchangeItemHistory
@@ -0,0 +1,285 @@
+#
+
+"""
+"""
+
+import csv
+from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+import logging
+import sqlite3
+
+from ..exchange_item import _SQL_FMT, ExchangeItem
+from .exchange_item import ITEMS_SCHEMA, ITEM_COLUMNS, item_to_row, row_to_item
+from .exchange_item_history import PRICE_HISTORY_SCHEMA, PRICE_HISTORY_COLUMNS, \
+    item_to_history_row
+
+
+__all__ = ['ExchangeData']
+
+LOGGER = logging.getLogger(__name__)
+
+# only replace an item's data if it is at least as new as what is stored
+_UPSERT_ITEM_FMT = '''
+INSERT INTO items ({columns}) VALUES ({params})
+ON CONFLICT (item_id) DO UPDATE SET {updates}
+WHERE items.date IS NULL OR excluded.date >= items.date
+'''
+_INSERT_HISTORY = 'INSERT OR REPLACE INTO price_history ({}) VALUES ({})'.format(
+    ', '.join(PRICE_HISTORY_COLUMNS), ', '.join('?' for _ in PRICE_HISTORY_COLUMNS))
+# each item along with its latest two prices, i.e. the price and last price of its module
+_SELECT_CURRENT_ITEMS = '''
+WITH ranked AS (
+    SELECT item_id, date, price, volume,
+        row_number() OVER (PARTITION BY item_id ORDER BY date DESC) AS n
+    FROM price_history {history_where}
+)
+SELECT {columns}, cur.date, cur.price, cur.volume, prev.date, prev.price
+FROM items i
+LEFT JOIN ranked cur ON cur.item_id = i.item_id AND cur.n = 1
+LEFT JOIN ranked prev ON prev.item_id = i.item_id AND prev.n = 2
+{items_where}
+ORDER BY i.item_id
+'''
+
+
+class ExchangeData:
+    """
+    A local sqlite store of exchange items and their price history.
+
+    Rows are loaded in batches using ``executemany``, with one transaction per batch, so loading
+    the full migrated history doesn't pay for a commit per row.
+
+    Example::
+
+        with ExchangeData('exchange.sqlite') as data:
+            data.load_csv('Fire_rune.csv')
+    """
+
+    def __init__(self, path: str, batch_size: int = 10000):
+        """
+        Create a new instance of ``ExchangeData``.
+
+        :param str path: The path to the sqlite database. Created if it does not exist.
+        :param int batch_size: The number of rows to insert per transaction.
+        """
+        self.path = path
+        self.batch_size = batch_size
+
+        self.conn = sqlite3.connect(path)
+        # write ahead logging makes bulk inserts considerably cheaper
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+        self.conn.executescript(ITEMS_SCHEMA + PRICE_HISTORY_SCHEMA)
+
+    def __enter__(self):
+        """
+        """
+        return self
+
+    def __exit__(self, err_type, err_val, err_tb):
+        """
+        """
+        self.close()
+
+    def close(self):
+        """
+        Close the underlying database connection.
+        """
+        self.conn.close()
+
+    def __executemany(self, sql: str, rows) -> int:
+        """
+        """
+        rows = iter(rows)
+        total = 0
+
+        while True:
+            batch = list(islice(rows, self.batch_size))
+
+            if not batch:
+                break
+
+            with self.conn:
+                self.conn.executemany(sql, batch)
+
+            total += len(batch)
+
+        return total
+
+    def load_item_rows(self, rows, columns: tuple = ITEM_COLUMNS) -> int:
+        """
+        Add or update rows of the ``items`` table. Rows are ignored if the stored data for the
+        item is newer.
+
+        :param rows: An iterable of tuples in the order of ``columns``.
+        :param tuple columns: The columns in each row, which must include ``item_id`` and
+            ``date``. Any other columns are left as they are when updating an item.
+
+        :return int: The number of rows given.
+        """
+        return self.__executemany(_upsert_item_sql(tuple(columns)), rows)
+
+    def load_history_rows(self, rows) -> int:
+        """
+        Add rows to the ``price_history`` table, replacing any existing price for the same item
+        and date.
+
+        :param rows: An iterable of tuples in the order of ``PRICE_HISTORY_COLUMNS``.
+
+        :return int: The number of rows given.
+        """
+        return self.__executemany(_INSERT_HISTORY, rows)
+
+    def load_items(self, items, columns: tuple = ITEM_COLUMNS) -> int:
+        """
+        Add or update items, along with their current price.
+
+        :param items: An iterable of ``ExchangeItem``.
+        :param tuple columns: The columns of the ``items`` table to set, see ``load_item_rows``.
+            Useful when the items only contain some of the data.
+
+        :return int: The number of items given.
+        """
+        items = [i for i in items if i.item_id is not None]
+        self.load_history_rows(r for r in map(item_to_history_row, items) if r is not None)
+        rows = map(item_to_row, items)
+
+        if tuple(columns) != ITEM_COLUMNS:
+            indexes = [ITEM_COLUMNS.index(c) for c in columns]
+            rows = (tuple(row[i] for i in indexes) for row in rows)
+
+        return self.load_item_rows(rows, columns)
+
+    def current_items(self, item_ids: list = None):
+        """
+        Generator for the stored items along with their current price, i.e. the data of their
+        exchange modules.
+
+        ``price`` and ``date`` are taken from the latest price in the price history, and ``last``
+        and ``last_date`` from the one before it. ``volume`` and ``volume_date`` are set if the
+        latest price has a volume.
+
+        :param list item_ids: The items to get. If not given, every item is included.
+
+        :return: A generator of ``ExchangeItem``, ordered by item ID.
+        """
+        params = []
+        history_where = items_where = ''
+
+        if item_ids is not None:
+            item_ids = list(item_ids)
+            in_list = ', '.join('?' for _ in item_ids)
+            history_where = 'WHERE item_id IN ({})'.format(in_list)
+            items_where = 'WHERE i.item_id IN ({})'.format(in_list)
+            params = item_ids + item_ids
+
+        columns = ', '.join('i."{}"'.format(c) for c in ITEM_COLUMNS)
+        sql = _SELECT_CURRENT_ITEMS.format(columns=columns, history_where=history_where,
+                                           items_where=items_where)
+        width = len(ITEM_COLUMNS)
+
+        for row in self.conn.execute(sql, params):
+            item = row_to_item(row[:width])
+            date, price, volume, last_date, last = row[width:]
+
+            if date is not None:
+                item.date = datetime.strptime(date, _SQL_FMT)
+                item.price = price
+
+            if last_date is not None:
+                item.last_date = datetime.strptime(last_date, _SQL_FMT)
+                item.last = last
+
+            if volume is not None:
+                item.volume = volume
+                item.volume_date = item.date
+
+            yield item
+
+    def load_csv(self, path: str, dedupe: bool = False) -> int:
+        """
+        Load the revisions of a module written by ``ExchangeCsvWriter``.
+
+        Every revision with a price is added to the price history, in revision order so the newest
+        revision wins if several have the same date. The item is updated using the newest revision.
+
+        :param str path: The CSV file to load.
+        :param bool dedupe: If ``True`` only load the oldest of each run of consecutive revisions
+            with the same data, see ``dedupe_revisions``.
+
+        :return int: The number of price history rows loaded.
+        """
+        key_columns = [c for c in ExchangeItem._ATTRS
+                       if c not in ('date', 'last_date', 'volume_date')]
+        rows = []
+        latest = None
+        prev = None
+
+        with open(path, newline='', encoding='utf-8') as fh:
+            csv_rows = [r for r in csv.DictReader(fh)
+                        if r['item_id'] and r['price'] and r['date']]
+
+        # the file is usually newest first, but the newest revision has to be written last so it
+        # replaces any older price with the same date, and runs are followed forwards in time
+        csv_rows.sort(key=lambda r: int(r['revid']))
+
+        for row in csv_rows:
+            # the item is updated from the newest revision even if it's part of a dropped run
+            if latest is None or row['date'] >= latest['date']:
+                latest = row
+
+            if dedupe:
+                key = tuple(row[c] for c in key_columns)
+
+                if key == prev:
+                    continue
+
+                prev = key
+
+            rows.append((int(row['item_id']), row['date'], int(row['price']),
+                         float(row['volume']) if row['volume'] else None,
+                         int(row['revid'])))
+
+        if latest is None:
+            LOGGER.debug('No prices found in %s', path)
+            return 0
+
+        self.load_history_rows(rows)
+        self.load_item_rows([_csv_row_to_item_row(latest)])
+
+        return len(rows)
+
+
+@lru_cache(maxsize=None)
+def _upsert_item_sql(columns: tuple) -> str:
+    """
+    Build the statement to add or update items with the given columns.
+    """
+    return _UPSERT_ITEM_FMT.format(
+        columns=', '.join('"{}"'.format(c) for c in columns),
+        params=', '.join('?' for _ in columns),
+        updates=', '.join('"{0}" = excluded."{0}"'.format(c) for c in columns if c != 'item_id'))
+
+
+def _csv_row_to_item_row(row: dict) -> tuple:
+    """
+    Convert a row written by ``ExchangeCsvWriter`` to a row of the ``items`` table.
+    """
+    def to_int(value):
+        return int(value) if value != '' else None
+
+    def to_bool(value):
+        return {'true': True, 'false': False}.get(value)
+
+    return (int(row['item_id']),
+            row['item'] or None,
+            to_int(row['value']),
+            to_int(row['limit']),
+            to_bool(row['members']),
+            to_int(row['category']),
+            to_bool(row['alchable']),
+            row['examine'] or None,
+            row['usage'] or None,
+            row['date'])
@@ -0,0 +1,77 @@
+#
+
+"""
+The ``items`` table, holding the latest known data for each item.
+"""
+
+from datetime import datetime
+
+from ..exchange_item import _SQL_FMT, ExchangeCategory, ExchangeItem
+
+
+__all__ = ['ITEMS_SCHEMA', 'ITEM_COLUMNS', 'item_to_row', 'row_to_item']
+
+ITEMS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS items (
+    item_id INTEGER PRIMARY KEY,
+    item TEXT,
+    value INTEGER,
+    "limit" INTEGER,
+    members INTEGER,
+    category INTEGER,
+    alchable INTEGER,
+    examine TEXT,
+    usage TEXT,
+    date TEXT
+);
+'''
+ITEM_COLUMNS = ('item_id', 'item', 'value', 'limit', 'members', 'category', 'alchable', 'examine',
+                'usage', 'date')
+
+
+def item_to_row(item: ExchangeItem) -> tuple:
+    """
+    Convert an item to a row of the ``items`` table.
+
+    :param ExchangeItem item: The item to convert.
+
+    :return tuple: The values in the order of ``ITEM_COLUMNS``.
+    """
+    category = item.category.value if item.category != ExchangeCategory.UNKNOWN else None
+    usage = '\n'.join(item.usage) if item.usage else None
+
+    return (item.item_id, item.item, item.value, item.limit, item.members, category,
+            item.alchable, item.examine, usage, item.date_sql)
+
+
+def row_to_item(row) -> ExchangeItem:
+    """
+    Convert a row of the ``items`` table to an item.
+
+    Columns that are ``NULL`` are left as ``None``, so they can be filled in from elsewhere.
+
+    :param row: The row, in the order of ``ITEM_COLUMNS``.
+
+    :rtype: ExchangeItem
+    """
+    values = dict(zip(ITEM_COLUMNS, row))
+
+    if values['category'] is not None:
+        values['category'] = ExchangeCategory(values['category'])
+
+    if values['date'] is not None:
+        values['date'] = datetime.strptime(values['date'], _SQL_FMT)
+
+    if values['usage'] is not None:
+        values['usage'] = values['usage'].split('\n')
+
+    for k in ('members', 'alchable'):
+        if values[k] is not None:
+            values[k] = bool(values[k])
+
+    kwargs = {k: v for k, v in values.items() if v is not None}
+
+    # a NULL alchable wasn't stored, e.g. by the ingest, so must not default to False
+    kwargs['alchable'] = values['alchable']
+
+    return ExchangeItem(**kwargs)
@@ -1,5 +1,209 @@
 #
 
 """
+The ``price_history`` table, holding every known price of each item.
 """
 
+from datetime import datetime
+
+from ..exchange_item import _SQL_FMT, ExchangeItem
+
+
+__all__ = ['PRICE_HISTORY_SCHEMA', 'PRICE_HISTORY_COLUMNS', 'item_to_history_row',
+           'ExchangeItemHistory']
+
+# keyed by (item_id, date) so range queries for an item are a single index scan
+# and indexed by date for range queries across every item
+PRICE_HISTORY_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS price_history (
+    item_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    price INTEGER NOT NULL,
+    volume REAL,
+    revid INTEGER,
+    PRIMARY KEY (item_id, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS price_history_date ON price_history (date);
+'''
+PRICE_HISTORY_COLUMNS = ('item_id', 'date', 'price', 'volume', 'revid')
+# expressions for the start of each period used for downsampling
+# weeks start on monday
+_PERIODS = {'day': "date(date)",
+            'week': "date(date, '-6 days', 'weekday 1')",
+            'month': "date(date, 'start of month')"}
+
+
+def item_to_history_row(item: ExchangeItem, revid: int = None) -> tuple:
+    """
+    Convert the current price of an item to a row of the ``price_history`` table.
+
+    :param ExchangeItem item: The item to convert.
+    :param int revid: The revision the price was taken from, if any.
+
+    :return tuple: The values in the order of ``PRICE_HISTORY_COLUMNS``, or ``None`` if the item
+        doesn't have an ID, price or date.
+    """
+    if item.item_id is None or item.price is None or item.date is None:
+        return None
+
+    return (item.item_id, item.date_sql, item.price, item.volume, revid)
+
+
+class ExchangeItemHistory:
+    """
+    Queries over the price history stored in an ``ExchangeData`` database.
+
+    Each query is answered by the database using the ``(item_id, date)`` primary key or the
+    ``date`` index, with any aggregation done by sqlite rather than row by row in Python. Dates
+    are given and returned in the same format as ``ExchangeItem.date_sql``, i.e.
+    ``YYYY-MM-DD HH:MM:SS``. ``datetime`` objects are also accepted.
+
+    Example::
+
+        with ExchangeData('exchange.sqlite') as data:
+            history = ExchangeItemHistory(data)
+            history.series(554, start='2018-01-01')
+    """
+
+    def __init__(self, data):
+        """
+        Create a new instance of ``ExchangeItemHistory``.
+
+        :param ExchangeData data: The database to query.
+        """
+        self.conn = data.conn
+
+    def latest_prices(self, item_ids: list = None) -> dict:
+        """
+        Get the latest price of each item.
+
+        :param list item_ids: The items to get prices for. If not given, every item is included.
+
+        :return dict: A dictionary mapping item IDs to a tuple of ``(date, price)``.
+        """
+        if item_ids is not None:
+            item_ids = list(item_ids)
+
+            # VALUES needs at least one row
+            if not item_ids:
+                return {}
+
+        if item_ids is None:
+            # walk the distinct item IDs using the primary key rather than scanning every row
+            ids = '''
+                WITH RECURSIVE ids (item_id) AS (
+                    SELECT MIN(item_id) FROM price_history
+                    UNION ALL
+                    SELECT (SELECT MIN(item_id) FROM price_history WHERE item_id > ids.item_id)
+                    FROM ids WHERE ids.item_id IS NOT NULL
+                )
+            '''
+            params = ()
+        else:
+            ids = 'WITH ids (item_id) AS (VALUES {})'.format(', '.join('(?)' for _ in item_ids))
+            params = item_ids
+
+        sql = ids + '''
+            SELECT p.item_id, p.date, p.price
+            FROM ids
+            JOIN price_history p ON p.item_id = ids.item_id AND p.date = (
+                SELECT MAX(date) FROM price_history WHERE item_id = ids.item_id)
+        '''
+
+        return {row[0]: (row[1], row[2]) for row in self.conn.execute(sql, params)}
+
+    def latest_price(self, item_id: int) -> tuple:
+        """
+        Get the latest price of an item.
+
+        :param int item_id: The item to get the price for.
+
+        :return tuple: The ``(date, price)``, or ``None`` if there are no prices for the item.
+        """
+        return self.conn.execute('SELECT date, price FROM price_history WHERE item_id = ? '
+                                 'ORDER BY date DESC LIMIT 1', (item_id,)).fetchone()
+
+    def series(self, item_id: int, start=None, end=None) -> list:
+        """
+        Get the prices of an item over a range of dates.
+
+        :param int item_id: The item to get prices for.
+        :param start: The earliest date to include, if any.
+        :param end: The date to stop before, if any.
+
+        :return list: A list of ``(date, price, volume)`` tuples, oldest first.
+        """
+        sql = 'SELECT date, price, volume FROM price_history WHERE item_id = ?'
+        params = [item_id]
+        sql += self.__date_range(params, start, end)
+
+        return self.conn.execute(sql + ' ORDER BY date', params).fetchall()
+
+    def ohlc(self, period: str = 'day', start=None, end=None, item_ids: list = None) -> list:
+        """
+        Downsample prices to the open, high, low and close price of each item per period.
+
+        :param str period: The length of each period, either ``day``, ``week`` or ``month``.
+        :param start: The earliest date to include, if any.
+        :param end: The date to stop before, if any.
+        :param list item_ids: The items to include. If not given, every item is included.
+
+        :return list: A list of ``(item_id, period_start, open, high, low, close, volume)``
+            tuples, ordered by item and then period. ``volume`` is the total volume of the
+            period, or ``None`` if there isn't any volume data.
+
+        :raises ValueError: If ``period`` is unknown.
+        """
+        try:
+            period_expr = _PERIODS[period]
+        except KeyError:
+            raise ValueError('Unknown period: {!r}'.format(period))
+
+        params = []
+        where = self.__date_range(params, start, end)
+
+        if item_ids is not None:
+            item_ids = list(item_ids)
+            where += ' AND item_id IN ({})'.format(', '.join('?' for _ in item_ids))
+            params.extend(item_ids)
+
+        sql = '''
+            SELECT DISTINCT item_id, period,
+                first_value(price) OVER w,
+                max(price) OVER w,
+                min(price) OVER w,
+                last_value(price) OVER w,
+                sum(volume) OVER w
+            FROM (SELECT item_id, {period} AS period, date, price, volume
+                  FROM price_history WHERE 1 = 1 {where})
+            WINDOW w AS (PARTITION BY item_id, period ORDER BY date
+                         ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+            ORDER BY item_id, period
+        '''.format(period=period_expr, where=where)
+
+        return self.conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def __date_range(params: list, start, end) -> str:
+        """
+        """
+        ret = ''
+
+        if start is not None:
+            ret += ' AND date >= ?'
+            params.append(_to_sql_date(start))
+
+        if end is not None:
+            ret += ' AND date < ?'
+            params.append(_to_sql_date(end))
+
+        return ret
+
+
+def _to_sql_date(value) -> str:
+    """
+    """
+    if isinstance(value, datetime):
+        return value.strftime(_SQL_FMT)
+
+    return value
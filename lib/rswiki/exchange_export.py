@@ -0,0 +1,358 @@
+#
+
+"""
+Writers for exporting parsed exchange revisions.
+"""
+
+from array import array
+import csv
+from datetime import datetime
+import os
+
+# optional, only needed for columnar exports
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from ..exception import ExchangeError
+from .exchange_item import ExchangeItem
+
+
+__all__ = ['ExchangeCsvWriter', 'ExchangeColumnarWriter', 'dedupe_revisions']
+
+# the revision data written after the item data
+# summary is taken from the revision's comment
+REVISION_FIELDS = ('user', 'userid', 'summary', 'timestamp', 'revid')
+# the columns of a columnar export and their types
+# dates are stored as seconds since the epoch, categories as ``ExchangeCategory`` values
+_COLUMNS = (('title', 'str'),
+            ('item', 'str'),
+            ('item_id', 'int'),
+            ('price', 'int'),
+            ('last', 'int'),
+            ('date', 'datetime'),
+            ('last_date', 'datetime'),
+            ('volume', 'float'),
+            ('volume_date', 'datetime'),
+            ('value', 'int'),
+            ('limit', 'int'),
+            ('members', 'bool'),
+            ('category', 'category'),
+            ('alchable', 'bool'),
+            ('examine', 'str'),
+            ('usage', 'str'),
+            ('user', 'str'),
+            ('userid', 'int'),
+            ('summary', 'str'),
+            ('timestamp', 'datetime'),
+            ('revid', 'int'))
+# numpy's representation of NaT as an int64
+_NAT = -2 ** 63
+_EPOCH = datetime(1970, 1, 1)
+_API_TIMESTAMP_FMT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def revision_to_row(revision: dict) -> list:
+    """
+    Convert the metadata of a revision to the values written after the item data.
+
+    :param dict revision: The revision as returned by the API.
+
+    :rtype: list
+    """
+    # convert API timestamps to SQL format
+    timestamp = revision['timestamp'].replace('Z', '').replace('T', ' ')
+
+    return [revision['user'], revision['userid'], revision['comment'], timestamp,
+            revision['revid']]
+
+
+def dedupe_revisions(revisions, stats: dict = None):
+    """
+    Collapse runs of consecutive revisions with the same data into the first revision of the run.
+
+    Revisions that only change dates, or that revert to the previous data, don't add a new price
+    point, so only the first revision of each run is kept. Revisions that failed to parse, i.e.
+    where the item is ``None``, are passed through and don't end a run.
+
+    :param revisions: An iterable of ``(revision, item)`` tuples, oldest first, so the revision
+        kept is the one that introduced the data.
+    :param dict stats: An optional dictionary to count the ``kept`` and ``dropped`` revisions in.
+
+    :return: A generator of ``(revision, item)`` tuples.
+    """
+    if stats is None:
+        stats = {}
+
+    stats.setdefault('kept', 0)
+    stats.setdefault('dropped', 0)
+    prev = None
+
+    for revision, item in revisions:
+        if item is not None:
+            key = item.data_key()
+
+            if key == prev:
+                stats['dropped'] += 1
+                continue
+
+            prev = key
+
+        stats['kept'] += 1
+        yield revision, item
+
+
+class ExchangeCsvWriter:
+    """
+    Writes the parsed revisions of a single exchange module to a CSV file.
+
+    The file is opened once and rows are written in batches. The file is synced to disk when it
+    is closed so a completed page is never left partially written.
+
+    Example::
+
+        with ExchangeCsvWriter('Fire_rune.csv') as writer:
+            for revision, item in revisions:
+                writer.write(item, revision)
+    """
+
+    HEADER = ExchangeItem._ATTRS + REVISION_FIELDS
+
+    def __init__(self, path: str, batch_size: int = 1000):
+        """
+        Create a new instance of ``ExchangeCsvWriter``. Any existing file at ``path`` is
+        overwritten.
+
+        :param str path: The file to write to.
+        :param int batch_size: The number of rows to hold before writing them out.
+        """
+        self.path = path
+        self.batch_size = batch_size
+
+        self._rows = []
+        self._fh = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._fh)
+        self._writer.writerow(self.HEADER)
+
+    def __enter__(self):
+        """
+        """
+        return self
+
+    def __exit__(self, err_type, err_val, err_tb):
+        """
+        """
+        self.close()
+
+    def write(self, item: ExchangeItem, revision: dict, title: str = None):
+        """
+        Add a parsed revision to the file.
+
+        :param ExchangeItem item: The parsed revision.
+        :param dict revision: The revision as returned by the API.
+        :param str title: Unused, as each file only contains a single page. Accepted for
+            compatibility with ``ExchangeColumnarWriter``.
+        """
+        self._rows.append(item.to_csv_row() + revision_to_row(revision))
+
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write any held rows to the file.
+        """
+        self._writer.writerows(self._rows)
+        self._rows = []
+
+    def close(self):
+        """
+        Write any held rows and sync the file to disk.
+        """
+        if self._fh.closed:
+            return
+
+        self.flush()
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._fh.close()
+
+
+class ExchangeColumnarWriter:
+    """
+    Writes parsed exchange revisions to a columnar file.
+
+    Values are held in typed buffers as they are added and written out in one go when the writer
+    is closed. The following formats are supported:
+
+    * ``npz``: A compressed NumPy archive with one array per column. Integer columns are
+      ``int64`` with a matching ``<name>_valid`` boolean array, dates are ``datetime64[s]`` with
+      ``NaT`` for missing values, booleans are ``int8`` with ``-1`` for missing values and
+      categories are ``int8`` ``ExchangeCategory`` values. Requires ``numpy``.
+    * ``parquet``: An Apache Parquet file using the equivalent nullable types. Requires ``numpy``
+      and ``pyarrow``.
+
+    A single writer can be used for many pages, as the title of each page is stored in the
+    ``title`` column.
+    """
+
+    FORMATS = ('npz', 'parquet')
+
+    def __init__(self, path: str, fmt: str = 'npz'):
+        """
+        Create a new instance of ``ExchangeColumnarWriter``.
+
+        :param str path: The file to write to.
+        :param str fmt: The format to write, one of ``FORMATS``.
+
+        :raises ExchangeError: If ``fmt`` is unknown or its dependencies aren't installed.
+        """
+        if fmt not in self.FORMATS:
+            raise ExchangeError('Unknown columnar format: {!r}'.format(fmt))
+
+        if numpy is None or (fmt == 'parquet' and pyarrow is None):
+            raise ExchangeError('The dependencies for {!r} exports are not installed'.format(fmt))
+
+        self.path = path
+        self.fmt = fmt
+
+        self._values = {}
+        self._valid = {}
+
+        for name, kind in _COLUMNS:
+            if kind == 'str':
+                self._values[name] = []
+            elif kind == 'float':
+                self._values[name] = array('d')
+            elif kind in ('bool', 'category'):
+                self._values[name] = array('b')
+            else:
+                self._values[name] = array('q')
+
+            if kind == 'int':
+                self._valid[name] = array('b')
+
+    def __enter__(self):
+        """
+        """
+        return self
+
+    def __exit__(self, err_type, err_val, err_tb):
+        """
+        """
+        self.close()
+
+    def __len__(self) -> int:
+        """
+        """
+        return len(self._values['revid'])
+
+    def write(self, item: ExchangeItem, revision: dict, title: str = None):
+        """
+        Add a parsed revision.
+
+        :param ExchangeItem item: The parsed revision.
+        :param dict revision: The revision as returned by the API.
+        :param str title: The title of the page the revision belongs to.
+        """
+        timestamp = datetime.strptime(revision['timestamp'], _API_TIMESTAMP_FMT)
+        extras = {'title': title,
+                  'user': revision['user'],
+                  'userid': revision['userid'],
+                  'summary': revision['comment'],
+                  'timestamp': timestamp,
+                  'revid': revision['revid']}
+
+        for name, kind in _COLUMNS:
+            if name in extras:
+                value = extras[name]
+            else:
+                value = getattr(item, name)
+
+            column = self._values[name]
+
+            if kind == 'int':
+                self._valid[name].append(value is not None)
+                column.append(value if value is not None else 0)
+
+            elif kind == 'float':
+                column.append(value if value is not None else float('nan'))
+
+            elif kind == 'datetime':
+                column.append(int((value - _EPOCH).total_seconds()) if value is not None else _NAT)
+
+            elif kind == 'bool':
+                column.append(int(value) if value is not None else -1)
+
+            elif kind == 'category':
+                column.append(value.value)
+
+            elif name == 'usage':
+                column.append('\n'.join(value) if value else None)
+
+            else:
+                column.append(value)
+
+    def close(self):
+        """
+        Write the buffered revisions to ``path``.
+        """
+        if self._values is None:
+            return
+
+        arrays = {}
+
+        for name, kind in _COLUMNS:
+            values = self._values[name]
+
+            if kind == 'str':
+                arrays[name] = numpy.array(values, dtype=object)
+            elif kind == 'datetime':
+                arrays[name] = numpy.frombuffer(values, dtype=numpy.int64).view('datetime64[s]')
+            else:
+                arrays[name] = numpy.frombuffer(values, dtype=values.typecode)
+
+            if kind == 'int':
+                arrays[name + '_valid'] = numpy.frombuffer(self._valid[name],
+                                                           dtype=numpy.int8).astype(bool)
+
+        if self.fmt == 'npz':
+            # strings are stored as unicode arrays so the file can be loaded without pickle
+            for name, kind in _COLUMNS:
+                if kind == 'str':
+                    arrays[name] = numpy.array(['' if v is None else v for v in arrays[name]],
+                                               dtype=str)
+
+            with open(self.path, 'wb') as fh:
+                numpy.savez_compressed(fh, **arrays)
+
+        else:
+            columns = {}
+
+            for name, kind in _COLUMNS:
+                values = arrays[name]
+
+                if kind == 'int':
+                    columns[name] = pyarrow.array(values, mask=~arrays[name + '_valid'])
+                elif kind == 'datetime':
+                    columns[name] = pyarrow.array(values, mask=numpy.isnat(values))
+                elif kind == 'float':
+                    columns[name] = pyarrow.array(values, mask=numpy.isnan(values))
+                elif kind == 'bool':
+                    columns[name] = pyarrow.array(values == 1, mask=values == -1)
+                elif kind == 'str':
+                    columns[name] = pyarrow.array(values, type=pyarrow.string())
+                else:
+                    columns[name] = pyarrow.array(values)
+
+            pyarrow.parquet.write_table(pyarrow.table(columns), self.path)
+
+        self._values = None
+        self._valid = None
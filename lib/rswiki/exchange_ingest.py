@@ -0,0 +1,390 @@
+#
+
+"""
+Ingest current prices from the Grand Exchange catalogue.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import logging
+import math
+import os
+from threading import Lock
+from time import monotonic, sleep
+from urllib.parse import quote
+
+import requests
+
+from ..exception import ExchangeError
+from ..util import json_dumps, json_loads
+from .exchange_db import ExchangeData
+from .exchange_item import ExchangeCategory, ExchangeItem
+
+
+__all__ = ['CatalogueSource', 'FixtureSource', 'ExchangeIngest']
+
+LOGGER = logging.getLogger(__name__)
+
+CATALOGUE_URL = 'https://secure.runescape.com/m=itemdb_rs/api/catalogue/'
+HEADERS = {'User-Agent': 'Cresbot v1.0.0'}
+# the number of items on each page of the catalogue
+PAGE_SIZE = 12
+# the item columns known by the catalogue, the others are left as they are when loading
+INGEST_COLUMNS = ('item_id', 'item', 'members', 'category', 'examine', 'date')
+# the first day counted by the catalogue's runedays
+RUNEDAY_EPOCH = datetime(2002, 2, 27)
+# prices abbreviated by the catalogue, which are rounded so aren't exact
+_PRICE_SUFFIXES = ('k', 'm', 'b')
+
+
+class CatalogueSource:
+    """
+    Requests pages of the Grand Exchange catalogue from Jagex.
+
+    Jagex respond to too many requests with an empty body rather than an error. When that happens,
+    or the connection fails, the request is retried after a pause and the delay between requests
+    is increased. This is safe to share between threads, the delay applies to every request made
+    using the instance.
+    """
+
+    def __init__(self, url: str = CATALOGUE_URL, delay: float = 0.0, timeout: float = 30.0,
+                 max_retries: int = 5, backoff: float = 10.0):
+        """
+        Create a new instance of ``CatalogueSource``.
+
+        :param str url: The base URL of the catalogue API.
+        :param float delay: The minimum number of seconds between requests.
+        :param float timeout: The number of seconds to wait for a response.
+        :param int max_retries: The number of times to retry a failed request.
+        :param float backoff: The number of seconds to pause before retrying a failed request.
+        """
+        self.url = url
+        self.delay = delay
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self.total_requests = 0
+        self.error_requests = 0
+
+        self._lock = Lock()
+        self._next = 0.0
+
+    def info(self) -> dict:
+        """
+        Get when the Grand Exchange was last updated.
+
+        :return dict: The response, e.g. ``{"lastConfigUpdateRuneday": 8000}``, where the runeday
+            is the number of days since ``RUNEDAY_EPOCH``.
+        """
+        return self._get('info.json', {})
+
+    def category(self, category: int) -> dict:
+        """
+        Get the number of items in a category starting with each letter.
+
+        :param int category: The ``ExchangeCategory`` value of the category.
+
+        :return dict: The response, e.g. ``{"types": [], "alpha": [{"letter": "a",
+            "items": 26}, ...]}``.
+        """
+        return self._get('category.json', {'category': category})
+
+    def items(self, category: int, alpha: str, page: int) -> dict:
+        """
+        Get a page of the items in a category starting with a letter.
+
+        :param int category: The ``ExchangeCategory`` value of the category.
+        :param str alpha: The letter the items start with, or ``#`` for numbers.
+        :param int page: The page to get, starting from 1.
+
+        :return dict: The response, e.g. ``{"total": 26, "items": [...]}``.
+        """
+        return self._get('items.json', {'category': category, 'alpha': alpha, 'page': page})
+
+    def _get(self, path: str, params: dict) -> dict:
+        """
+        """
+        for attempt in range(self.max_retries + 1):
+            with self._lock:
+                wait = self._next - monotonic()
+                self._next = max(self._next, monotonic()) + self.delay
+
+            if wait > 0:
+                sleep(wait)
+
+            with self._lock:
+                self.total_requests += 1
+
+            try:
+                res = requests.get(self.url + path, params=params, headers=HEADERS,
+                                   timeout=self.timeout)
+                res.raise_for_status()
+                return json_loads(res.content)
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError,
+                    ValueError) as exc:
+                error = exc
+
+            with self._lock:
+                self.error_requests += 1
+                self.delay += 0.5
+
+            LOGGER.warning('Request error for %s with %r: %s, assuming ratelimit, retrying in %ss '
+                           'with a delay of %ss between requests', path, params, error,
+                           self.backoff, self.delay)
+            sleep(self.backoff)
+
+        raise ExchangeError('Too many failed requests for {!r} with {!r}'.format(path, params))
+
+
+class FixtureSource:
+    """
+    A stand-in for ``CatalogueSource`` that reads responses from JSON files, for running without
+    access to the catalogue.
+
+    Responses are read from ``info.json``, ``category-<category>.json`` and
+    ``items-<category>-<alpha>-<page>.json`` in ``directory``, where ``alpha`` is URL encoded.
+    If ``source`` is given, responses without a file are requested from it and saved, which can
+    be used to record a set of fixtures.
+    """
+
+    def __init__(self, directory: str, source: CatalogueSource = None):
+        """
+        Create a new instance of ``FixtureSource``.
+
+        :param str directory: The directory containing the responses.
+        :param CatalogueSource source: An optional source to request missing responses from.
+        """
+        self.directory = directory
+        self.source = source
+
+        self.total_requests = 0
+        self.error_requests = 0
+
+        self._lock = Lock()
+
+    def info(self) -> dict:
+        """
+        Equivalent of ``CatalogueSource.info``.
+        """
+        return self._get('info.json', 'info')
+
+    def category(self, category: int) -> dict:
+        """
+        Equivalent of ``CatalogueSource.category``.
+        """
+        return self._get('category-{}.json'.format(category), 'category', category)
+
+    def items(self, category: int, alpha: str, page: int) -> dict:
+        """
+        Equivalent of ``CatalogueSource.items``.
+        """
+        filename = 'items-{}-{}-{}.json'.format(category, quote(alpha, safe=''), page)
+
+        return self._get(filename, 'items', category, alpha, page)
+
+    def _get(self, filename: str, method: str, *args) -> dict:
+        """
+        """
+        path = os.path.join(self.directory, filename)
+
+        with self._lock:
+            self.total_requests += 1
+
+        try:
+            with open(path, 'rb') as fh:
+                return json_loads(fh.read())
+
+        except FileNotFoundError:
+            if self.source is None:
+                with self._lock:
+                    self.error_requests += 1
+
+                raise ExchangeError('No fixture found at: {!r}'.format(path))
+
+        ret = getattr(self.source, method)(*args)
+
+        with open(path, 'wb') as fh:
+            fh.write(json_dumps(ret))
+
+        return ret
+
+
+class ExchangeIngest:
+    """
+    Fetches the current price of every item in the Grand Exchange catalogue.
+
+    Each category is fetched in its own thread, as most of the time is spent waiting for
+    responses. The number of items, requests and seconds taken for each category are kept in
+    ``metrics``.
+
+    Prices are dated by the day of the latest Grand Exchange update, so fetching them again before
+    the next update replaces them rather than adding to the price history. Prices the catalogue
+    abbreviates, e.g. ``'12.3k'``, aren't exact, so those items are loaded without a price.
+
+    Example::
+
+        ingest = ExchangeIngest(CatalogueSource(delay=1))
+
+        with ExchangeData('exchange.sqlite') as data:
+            ingest.load(data)
+    """
+
+    def __init__(self, source, jobs: int = 4):
+        """
+        Create a new instance of ``ExchangeIngest``.
+
+        :param source: Where to get the catalogue from, either ``CatalogueSource`` or
+            ``FixtureSource``.
+        :param int jobs: The number of categories to fetch at once.
+        """
+        self.source = source
+        self.jobs = jobs
+        self.metrics = {}
+
+    def update_date(self) -> datetime:
+        """
+        Get the day of the latest Grand Exchange update, which the current prices are from.
+
+        :rtype: datetime
+        """
+        return RUNEDAY_EPOCH + timedelta(days=self.source.info()['lastConfigUpdateRuneday'])
+
+    def fetch_category(self, category: ExchangeCategory, date: datetime = None) -> list:
+        """
+        Fetch the items in a category.
+
+        :param ExchangeCategory category: The category to fetch.
+        :param datetime date: The date to give the prices. Defaults to ``update_date``.
+
+        :return list: The items as ``ExchangeItem``. Items that can't be converted are logged
+            and skipped.
+        """
+        if date is None:
+            date = self.update_date()
+
+        start = monotonic()
+        requests_made = 1
+        ret = []
+
+        for alpha in self.source.category(category.value)['alpha']:
+            pages = math.ceil(alpha['items'] / PAGE_SIZE)
+
+            for page in range(1, pages + 1):
+                res = self.source.items(category.value, alpha['letter'], page)
+                requests_made += 1
+
+                for data in res.get('items', []):
+                    try:
+                        ret.append(catalogue_item_to_item(data, category, date))
+                    except (KeyError, ValueError) as exc:
+                        LOGGER.warning('Unable to convert %r: %s', data, exc)
+
+        seconds = monotonic() - start
+        self.metrics[category] = {'items': len(ret),
+                                  'requests': requests_made,
+                                  'seconds': seconds,
+                                  'items_per_second': len(ret) / seconds if seconds else 0.0}
+        LOGGER.debug('Fetched %s items from %s in %.1fs', len(ret), category.to_name(), seconds)
+
+        return ret
+
+    def iter_fetch(self, categories: list = None):
+        """
+        Fetch the items in many categories at once.
+
+        :param list categories: The ``ExchangeCategory`` to fetch. Defaults to every category.
+
+        :return: A generator of lists of ``ExchangeItem``, one for each category as soon as it
+            has been fetched.
+        """
+        if categories is None:
+            categories = [c for c in ExchangeCategory if c is not ExchangeCategory.UNKNOWN]
+
+        date = self.update_date()
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = [executor.submit(self.fetch_category, c, date) for c in categories]
+
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                # don't start the remaining categories if one failed
+                for future in futures:
+                    future.cancel()
+
+    def fetch(self, categories: list = None) -> list:
+        """
+        Fetch the items in many categories at once.
+
+        :param list categories: The ``ExchangeCategory`` to fetch. Defaults to every category.
+
+        :return list: The items as ``ExchangeItem``, in the order the categories were fetched.
+        """
+        return [item for items in self.iter_fetch(categories) for item in items]
+
+    def load(self, data: ExchangeData, categories: list = None) -> int:
+        """
+        Fetch the items in many categories and add their prices to a database.
+
+        Each category is loaded as soon as it has been fetched. Only the columns known by the
+        catalogue, see ``INGEST_COLUMNS``, are updated for items that are already stored.
+
+        :param ExchangeData data: The database to add the prices to.
+        :param list categories: The ``ExchangeCategory`` to fetch. Defaults to every category.
+
+        :return int: The number of items loaded.
+        """
+        total = 0
+
+        for items in self.iter_fetch(categories):
+            total += data.load_items(items, INGEST_COLUMNS)
+
+        return total
+
+
+def catalogue_item_to_item(data: dict, category: ExchangeCategory,
+                           date: datetime) -> ExchangeItem:
+    """
+    Convert an item from the catalogue to an ``ExchangeItem``.
+
+    :param dict data: The item as returned by the catalogue.
+    :param ExchangeCategory category: The category the item was found in.
+    :param datetime date: The date to give the price.
+
+    :return ExchangeItem: The item, without a price if the catalogue abbreviated it.
+
+    :raises KeyError: If ``data`` is missing the ID or price.
+    :raises ValueError: If the price could not be converted.
+    """
+    return ExchangeItem(item=data.get('name'),
+                        item_id=data['id'],
+                        price=_parse_price(data['current']['price']),
+                        date=date,
+                        members=data.get('members'),
+                        category=category,
+                        examine=data.get('description'))
+
+
+def _parse_price(value) -> int:
+    """
+    Convert a price from the catalogue, e.g. ``5`` or ``'1,234'``.
+
+    :return int: The price, or ``None`` if it is abbreviated, e.g. ``'12.3k'`` or ``'1.2b'``, as
+        the exact price isn't known.
+    """
+    if isinstance(value, int):
+        return value
+
+    value = str(value).replace(',', '').strip().lower()
+
+    try:
+        if value.endswith(_PRICE_SUFFIXES):
+            # still check it's a price
+            float(value[:-1])
+            return None
+
+        return int(value)
+    except ValueError as exc:
+        raise ValueError('Unable to convert price: {!r}'.format(value)) from exc
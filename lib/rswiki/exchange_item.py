@@ -25,7 +25,11 @@ Yay!
 
 from datetime import datetime, timedelta
 from enum import Enum
+from collections import Counter
+from functools import lru_cache
 import logging
+import math
+from operator import attrgetter
 import re
 
 import mwparserfromhell
@@ -34,7 +38,7 @@ from ..exception import ExchangeTemplateMissingError, ExchangeTemplateConvertedE
 from .exchange_module_parser import ExchangeModuleParser
 
 
-__all__ = ['ExchangeCategory', 'ExchangeItem']
+__all__ = ['ExchangeCategory', 'ExchangeItem', 'take_unknown_attrs', 'report_unknown_attrs']
 
 _FIRST_CAP_RE = re.compile('(.)([A-Z][a-z]+)')
 _ALL_CAP_RE = re.compile('([a-z0-9])([A-Z])')
@@ -77,7 +81,69 @@ _DATETIME_FMTS = ['%H:%M, %B %d, %Y (UTC)',
                   '%H:%M, %d %B %Y (EST',
                   '%H:%M, %d %B %Y (AEST)'
                   ]
+# the order _DATETIME_FMTS are tried in and how often each has been used
+# see _parse_datetime
+_datetime_fmts = list(_DATETIME_FMTS)
+_datetime_fmt_hits = dict.fromkeys(_DATETIME_FMTS, 0)
+_WIKILINK_RE = re.compile(r'\[\[.*?\]\]')
+_TEMPLATE_RE = re.compile(r'\{\{.*?\}\}')
 _SQL_FMT = '%Y-%m-%d %H:%M:%S'
+# the type of each attribute, see _field_plan
+_ATTR_KINDS = {'item': 'str',
+               'item_id': 'int',
+               'price': 'int',
+               'last': 'int',
+               'date': 'datetime',
+               'last_date': 'datetime',
+               'volume': 'float',
+               'volume_date': 'datetime',
+               'value': 'int',
+               'limit': 'int',
+               'members': 'bool',
+               'category': 'category',
+               'alchable': 'bool',
+               'examine': 'str',
+               'usage': 'list'}
+# escapes for quoting strings in modules
+# control characters use 3 digit decimal escapes so they can't run into a following digit
+_LUA_ESCAPES = {i: '\\{:03d}'.format(i) for i in list(range(32)) + [127]}
+_LUA_ESCAPES.update({ord('\\'): '\\\\', ord("'"): "\\'", ord('\n'): '\\n', ord('\r'): '\\r',
+                     ord('\t'): '\\t'})
+# keys that can be written without brackets in modules
+_LUA_NAME_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+_LUA_KEYWORDS = frozenset(('and', 'break', 'do', 'else', 'elseif', 'end', 'false', 'for',
+                           'function', 'goto', 'if', 'in', 'local', 'nil', 'not', 'or', 'repeat',
+                           'return', 'then', 'true', 'until', 'while'))
+# marks an attribute that wasn't given, see from_module_batch
+_MISSING = object()
+# for cleaning up exchange pages, see ExchangeItem.from_page
+_NOINCLUDE_RE = re.compile(r'<noinclude>[\s\S]*?</noinclude>', flags=re.MULTILINE)
+_CATEGORY_RE = re.compile(r'\[\[Category:.+?\]\]')
+_DEFAULTSORT_RE = re.compile(r'\{\{DEFAULTSORT:.+?\}\}')
+_COMMENT_RE = re.compile(r'<!--[\s\S]*?-->', flags=re.MULTILINE)
+_VALUE_COMMENT_RE = re.compile('<!--.*?-->', flags=re.MULTILINE)
+# for finding the ExchangeItem template and splitting its parameters without mwparserfromhell
+# see _find_exchange_template_params
+_EXCHANGE_TEMPLATE_RE = re.compile(r'\{\{\s*ExchangeItem\s*(?=\||\}\})')
+_BRACES_RE = re.compile(r'\{\{|\}\}')
+_LINKS_RE = re.compile(r'\[\[|\]\]')
+_TEMPLATE_TOKENS_RE = re.compile(r'\{\{\{|\}\}\}|\{\{|\}\}|\[\[|\]\]|[{}\[\]<>|=]')
+_NESTED_CLOSE = {'}}': '{{', ']]': '[['}
+# the forms of integer handled by convert_to_int, tried in order
+# anything else is given to int() as is
+_INT_RE = re.compile(r'''
+    (?P<text>[^0-9]+)\Z                         # just text
+  | (?P<spaced>[\d ]+)\Z                        # 1 000 000
+  | (?P<dotted>[\d.]+)\Z                        # 1.000.000
+  | (?P<range>(?P<low>\d+)(?:\s*-\s*|\s+to\s+)(?P<high>\d+))\Z  # 1000-2000 or 1000 to 2000
+  | (?P<number>.*?)(?P<suffix>k|m|mil|mill)\Z   # 1.5k, 2m, 3mil
+  | (?P<other>)
+''', re.VERBOSE | re.DOTALL)
+_INT_SUFFIXES = {'k': 1000,
+                 'm': 1000000,
+                 'mil': 1000000,
+                 'mill': 1000000,
+                }
 _CATEGORY_ERRORS = ("Unexpected value for 'category': 'nil'",
                    "Unexpected value for 'category': ''")
 _MAP_ATTRS = {'lw_alch': 'low_alch',
@@ -98,6 +164,10 @@ _MAP_ATTRS = {'lw_alch': 'low_alch',
               'l_ast': 'last',
               'low': 'low_alch',
               }
+# keys normalised by _normalise_key, seeded with the known keys once ExchangeItem is defined
+_KEYS = {}
+# unknown attributes found since take_unknown_attrs was last called
+_UNKNOWN_ATTRS = Counter()
 _DATETIME_REPLACEMENTS = {'feb': 'February',
                           'rd': '', # as in 3rd
                           'th': '', # as in 4th
@@ -164,29 +234,119 @@ class ExchangeCategory(Enum):
 
     def to_name(self) -> str:
         """
+        Get the name of the category as used by Jagex and in exchange modules, e.g.
+        ``Runes, Spells and Teleports``.
+
+        :rtype: str
+        """
+        return _CATEGORY_NAMES[self]
+
+    @classmethod
+    def from_name(cls, name: str):
         """
-        parts = self.name.split('_')
+        Find the category with a name, as found in exchange modules and pages.
 
-        if parts[0] == 'MELEE':
-            parts.insert(2, '-')
+        Names are matched ignoring case, commas and how words are separated, e.g.
+        ``Melee armour - low level`` and ``melee_armour_low_level`` are both found. A few old or
+        misspelt names are also accepted, such as ``Jewelry``, ``Herbs`` and ``Flatpacks``.
 
-        elif parts[0] == 'RUNES':
-            parts[0] += ','
+        :param str name: The name of the category.
 
-        for i, p in enumerate(parts):
-            if i == 0:
-                p = p.capitalize()
-            else:
-                p = p.lower()
+        :rtype: ExchangeCategory
+
+        :raises ValueError: If no category has the name.
+        """
+        category, _ = _find_category(name)
+
+        if category is None:
+            raise ValueError('Unexpected value for {!r}: {!r}'.format('category', name))
+
+        return category
+
+    @classmethod
+    def from_id(cls, value):
+        """
+        Find the category with an ID, as used by the Grand Exchange Database.
+
+        :param value: The ID of the category, as an ``int`` or string of digits.
+
+        :rtype: ExchangeCategory
+
+        :raises ValueError: If no category has the ID.
+        """
+        try:
+            return _CATEGORY_IDS[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Unexpected value for {!r}: {!r}'.format('category', value))
+
+
+def _category_name(category: ExchangeCategory) -> str:
+    """
+    Build the display name of a category from the name of its member.
+    """
+    parts = category.name.split('_')
+
+    if parts[0] == 'MELEE':
+        parts.insert(2, '-')
+
+    elif parts[0] == 'RUNES':
+        parts[0] += ','
 
-            # jagex seem to capitalise words based on the phase of the moon when they wrote it
-            # this doesn't do all of those, but it's consistent enough for our purposes
-            if p in ('drink', 'smithing', 'spells', 'teleports'):
-                p = p.capitalize()
+    for i, p in enumerate(parts):
+        if i == 0:
+            p = p.capitalize()
+        else:
+            p = p.lower()
+
+        # jagex seem to capitalise words based on the phase of the moon when they wrote it
+        # this doesn't do all of those, but it's consistent enough for our purposes
+        if p in ('drink', 'smithing', 'spells', 'teleports'):
+            p = p.capitalize()
+
+        parts[i] = p
+
+    return ' '.join(parts)
+
+
+def _normalise_category(value: str) -> str:
+    """
+    Normalise a category name for looking up in ``_CATEGORY_INDEX``.
+    """
+    return _CATEGORY_SEPARATORS_RE.sub('_', value.replace(',', '').strip()).upper()
+
+
+@lru_cache(maxsize=1024)
+def _find_category(value: str) -> tuple:
+    """
+    Find the category with a name.
+
+    :return tuple: The category, or ``None`` if there isn't one, and whether the name was
+        a misspelling that should be logged.
+    """
+    key = _normalise_category(value)
+
+    if key in _CATEGORY_INDEX:
+        return _CATEGORY_INDEX[key]
+
+    # handle quirky spellings of jewellery and a couple of odd instances of herbs
+    for prefix, category in _CATEGORY_PREFIXES:
+        if key.startswith(prefix):
+            return category, True
+
+    return None, False
 
-            parts[i] = p
 
-        return ' '.join(parts)
+# precomputed lookups for ExchangeCategory
+_CATEGORY_NAMES = {c: _category_name(c) for c in ExchangeCategory}
+_CATEGORY_IDS = {c.value: c for c in ExchangeCategory}
+_CATEGORY_SEPARATORS_RE = re.compile(r'[\s_-]+')
+# normalised names mapped to the category and whether the name should be logged as corrected
+_CATEGORY_INDEX = {_normalise_category(c.name): (c, False) for c in ExchangeCategory}
+_CATEGORY_INDEX.update({_normalise_category(n): (c, False) for c, n in _CATEGORY_NAMES.items()})
+# old name for construction products
+_CATEGORY_INDEX['FLATPACKS'] = (ExchangeCategory.CONSTRUCTION_PRODUCTS, False)
+_CATEGORY_PREFIXES = (('JEWEL', ExchangeCategory.JEWELLERY),
+                      ('HERBS', ExchangeCategory.HERBLORE_MATERIALS))
 
 
 class ExchangeItem:
@@ -203,10 +363,13 @@ class ExchangeItem:
                       'abs_max_price', 'direction', 'street', 'score', 'obj', 'store_sell', 'desc',
                       'currency', 'exchange', 'abs_list_price', 'detail', 'destroy', 'lowalch', 'hialch',)
 
-    def __init__(self, allow_category_nil: bool = False, **kwargs):
+    def __init__(self, allow_category_nil: bool = False, lazy: bool = False, **kwargs):
         """
         Create a new instance of ``ExchangeItem``.
 
+        :param bool lazy: If ``True`` values are stored as given and only converted when they are
+            first accessed, so any errors are raised then rather than logged. Use ``validate`` to
+            convert every value.
         :param **kwargs: Key-value arguments for the object attributes. The following attributes
             are valid:
 
@@ -254,12 +417,17 @@ class ExchangeItem:
             else:
                 setattr(self, '_' + attr, None)
 
+        pending = {} if lazy else None
+
         for k, v in kwargs.items():
-            if k in _MAP_ATTRS.keys():
-                k = _MAP_ATTRS[k]
+            name, attr = _normalise_key(k)
+
+            if attr:
+                k = attr
 
-            if k in self._ATTRS:
-                if k == 'category' and allow_category_nil:
+                if pending is not None:
+                    pending[k] = v
+                elif k == 'category' and allow_category_nil:
                     try:
                         self.category = v
                     except ValueError as exc:
@@ -273,16 +441,49 @@ class ExchangeItem:
                     except ValueError as exc:
                         LOGGER.warning(str(exc))
 
-            elif k in self._IGNORED_ATTRS:
-                pass
-
-            else:
-                msg = 'Unknown attribute found: name={!s}, value={!r}'.format(k, v)
-                LOGGER.warning(msg)
+            elif attr is None:
+                _found_unknown_attr(name, v)
 
         if 'alchable' not in kwargs:
             self.alchable = False
 
+        if pending:
+            # remove the primed values so they're found by __getattr__
+            for attr in pending:
+                del self.__dict__['_' + attr]
+
+            self._pending = pending
+            self._allow_category_nil = allow_category_nil
+
+    def __getattr__(self, name: str):
+        """
+        Convert a value pending in lazy mode when it is first accessed.
+        """
+        pending = self.__dict__.get('_pending')
+
+        if pending and name[:1] == '_' and name[1:] in pending:
+            attr = name[1:]
+            value = pending[attr]
+
+            if attr == 'category' and self._allow_category_nil:
+                try:
+                    self.category = value
+                except ValueError as exc:
+                    if not str(exc).endswith(_CATEGORY_ERRORS):
+                        raise
+
+                    self.category = ExchangeCategory.UNKNOWN
+            else:
+                setattr(self, attr, value)
+
+            # only once it's converted, so an invalid value raises on every access
+            del pending[attr]
+
+            return self.__dict__[name]
+
+        raise AttributeError('{!r} object has no attribute {!r}'
+                             .format(self.__class__.__name__, name))
+
     def __repr__(self) -> str:
         """
         """
@@ -315,94 +516,303 @@ class ExchangeItem:
 
         return ret
 
-    def to_module(self) -> str:
+    def validate(self):
         """
-        Convert the instance to a Lua table to be used for an exchange module.
+        Convert any values still pending in lazy mode.
 
-        :rtype: str
+        :raises ValueError: If a value is invalid.
         """
-        values = []
+        for attr in list(self.__dict__.get('_pending') or ()):
+            getattr(self, attr)
+
+    def data_key(self) -> tuple:
+        """
+        Get the item's data, ignoring the dates it was updated.
+
+        Consecutive revisions with the same key only differ in their dates, e.g. an edit that
+        only touched ``date`` or a revert, so can be treated as a single price point.
+
+        :rtype: tuple
+        """
+        ret = []
 
         for attr in self._ATTRS:
-            key = snakecase_to_camelcase(attr)
+            if attr in ['date', 'last_date', 'volume_date']:
+                continue
 
-            if attr == 'usage':
-                usage = [' ' * 8 + repr(u) for u in self.usage]
-                val = ',\n'.join(usage)
+            value = getattr(self, attr)
 
-                values.append('    {!s} = {\n{!s}\n    }'.format(key, val))
+            # lists can't be hashed
+            if isinstance(value, list):
+                value = tuple(value)
 
-            else:
-                val = getattr(self, attr)
+            ret.append(value)
 
-                if isinstance(val, datetime):
-                    val = val.strftime(_DATETIME_FMT)
+        return tuple(ret)
 
-                elif isinstance(val, ExchangeCategory):
-                    val = val.to_name
+    def to_module(self, extra: dict = None) -> str:
+        """
+        Convert the instance to a Lua table to be used for an exchange module.
 
-                if val is None:
-                    values.append('    {!s} = nil'.format(key))
-                else:
-                    values.append('    {!s} = {!r}'.format(key, val))
+        :param dict extra: Fields to write after the attributes, such as those found by
+            ``from_module`` that aren't attributes, e.g. ``icon``.
 
-        return 'return {\n' + ',\n'.join(values) + '\n}\n'
+        :rtype: str
+        """
+        return _format_module(_field_plan(self.__class__, 'module'), self, extra)
 
     def to_csv(self) -> str:
         """
         """
-        ret = []
+        return ','.join(_format_fields(_field_plan(self.__class__, 'csv'), self))
 
-        for attr in self._ATTRS:
-            if attr in ['date', 'last_date', 'volume_date']:
-                attr += '_sql'
+    def to_csv_row(self) -> list:
+        """
+        Convert the instance to a row of values to be written using ``csv.writer``.
 
-            value = getattr(self, attr)
+        Unlike ``to_csv`` strings are not quoted, leaving that to the writer.
 
-            if value is None:
-                value = ''
-            elif value is True or value is False:
-                value = str(value).lower()
-            elif isinstance(value, ExchangeCategory):
-                value = value.value
+        :rtype: list
+        """
+        return _format_fields(_field_plan(self.__class__, 'csv_row'), self)
 
-                if value == -1:
-                    value = ''
-                else:
-                    value = str(value)
-            else:
-                if isinstance(value, str):
-                    value = repr(value)
-                else:
-                    value = str(value)
+    @classmethod
+    def write_csv(cls, items, stream, header: bool = False) -> int:
+        """
+        Write many items to a stream in the format of ``to_csv``, one item per line.
 
-            ret.append(value)
+        :param items: An iterable of ``ExchangeItem``, or anything with the same attributes such
+            as ``ExchangeRecord``.
+        :param stream: A file-like object opened in text mode.
+        :param bool header: If ``True`` write the attribute names as the first line.
+
+        :return int: The number of items written.
+        """
+        plans = {}
+        count = 0
+
+        def lines():
+            nonlocal count
+
+            if header:
+                yield ','.join(cls._ATTRS) + '\n'
+
+            for item in items:
+                item_cls = item.__class__
 
-        return ','.join(ret)
+                if item_cls not in plans:
+                    plans[item_cls] = _field_plan(item_cls, 'csv')
+
+                count += 1
+                yield ','.join(_format_fields(plans[item_cls], item)) + '\n'
+
+        stream.writelines(lines())
+
+        return count
+
+    @classmethod
+    def write_modules(cls, items, stream) -> int:
+        """
+        Write the exchange modules of many items to a stream, in the format of ``to_module``.
+
+        Each module is a complete Lua chunk, so they are separated by a line containing only
+        ``--``, which is a comment in Lua.
+
+        :param items: An iterable of ``ExchangeItem``, or anything with the same attributes such
+            as ``ExchangeRecord``.
+        :param stream: A file-like object opened in text mode.
+
+        :return int: The number of items written.
+        """
+        plans = {}
+        count = 0
+
+        def modules():
+            nonlocal count
+
+            for item in items:
+                item_cls = item.__class__
+
+                if item_cls not in plans:
+                    plans[item_cls] = _field_plan(item_cls, 'module')
+
+                if count:
+                    yield '--\n'
+
+                count += 1
+                yield _format_module(plans[item_cls], item)
+
+        stream.writelines(modules())
+
+        return count
 
     @classmethod
-    def from_module(cls, text: str, allow_category_nil: bool = False):
+    def from_module(cls, text: str, allow_category_nil: bool = False, lazy: bool = False,
+                    extra: dict = None):
         """
         Create an instance of ``ExchangeItem`` from the content of an exchange module,
         e.g. ``Module:Exchange/Fire rune``.
 
         :param str text: The content of the module.
+        :param bool lazy: If ``True`` only convert values when they are accessed.
+        :param dict extra: If given, the fields of the module that don't set an attribute, e.g.
+            ``icon``, are added to it as they were written, so they can be kept by ``to_module``.
 
         :return ExchangeItem: An instance of ExchangeItem containing the data found in ``text``.
         """
         parser = ExchangeModuleParser(text)
         data = parser.parse()
-        attrs = {camelcase_to_snakecase(k): v for k, v in data.items()}
 
-        return cls(allow_category_nil=allow_category_nil, **attrs)
+        if extra is not None:
+            extra.update((k, v) for k, v in data.items()
+                         if isinstance(k, str) and not _normalise_key(k)[1])
+
+        return cls(allow_category_nil=allow_category_nil, lazy=lazy, **_module_attrs(data))
+
+    @classmethod
+    def from_module_batch(cls, texts, allow_category_nil: bool = False) -> list:
+        """
+        Create instances of ``ExchangeItem`` from the content of many exchange modules, such as
+        the revisions of a module.
+
+        The result is the same as calling ``from_module`` for each module, except that modules
+        that can't be parsed give ``None`` rather than raising an error. Rather than converting
+        each item in turn, each attribute is converted for every module at once, and each
+        distinct value is only converted once. Values that can't be cached, i.e. lists, are
+        converted one at a time.
+
+        :param texts: An iterable of the contents of the modules.
+
+        :return list: A list of ``ExchangeItem``, or ``None`` for any modules that couldn't be
+            parsed.
+        """
+        rows = []
+
+        for text in texts:
+            try:
+                rows.append(_module_attrs(ExchangeModuleParser(text).parse()))
+            except ValueError as exc:
+                LOGGER.debug('Failed to parse module: %s', exc)
+                rows.append(None)
+
+        columns = {attr: [_MISSING] * len(rows) for attr in cls._ATTRS}
+
+        for i, row in enumerate(rows):
+            if row is None:
+                continue
+
+            for k, v in row.items():
+                name, attr = _normalise_key(k)
+
+                if attr:
+                    columns[attr][i] = v
+
+                elif attr is None:
+                    _found_unknown_attr(name, v)
+
+        # item is converted first so it's available for category's warnings
+        columns['item'] = cls._convert_column('item', columns['item'])
+
+        for attr in cls._ATTRS:
+            if attr != 'item':
+                columns[attr] = cls._convert_column(attr, columns[attr], allow_category_nil,
+                                                    columns['item'])
+
+        ret = []
+
+        for i, row in enumerate(rows):
+            if row is None:
+                ret.append(None)
+                continue
+
+            item = cls.__new__(cls)
+
+            for attr in cls._ATTRS:
+                value = columns[attr][i]
+
+                if value is _MISSING:
+                    if attr == 'category':
+                        value = ExchangeCategory.UNKNOWN
+                    elif attr == 'alchable':
+                        value = False
+                    else:
+                        value = None
+
+                setattr(item, '_' + attr, value)
+
+            ret.append(item)
+
+        return ret
+
+    @classmethod
+    def _convert_column(cls, attr: str, column: list, allow_category_nil: bool = False,
+                        names: list = None) -> list:
+        """
+        Convert every value of an attribute for ``from_module_batch``.
+
+        Values are converted using the attribute's setter, and errors are handled in the same way
+        as ``__init__``, leaving the attribute's default.
+        """
+        setter = getattr(cls, attr).fset
+        scratch = cls.__new__(cls)
+        scratch._item = None
+        ret = list(column)
+        cache = {}
+
+        for i, value in enumerate(ret):
+            if value is _MISSING:
+                continue
+
+            if attr == 'category':
+                # not cached as the warnings for corrected categories name the item
+                scratch._item = names[i] if names[i] is not _MISSING else None
+
+                try:
+                    setter(scratch, value)
+                except ValueError as exc:
+                    if not allow_category_nil:
+                        LOGGER.warning(str(exc))
+
+                    ret[i] = ExchangeCategory.UNKNOWN
+                else:
+                    ret[i] = scratch._category
+
+                continue
+
+            # bool and int are equal, so the type is part of the key
+            try:
+                key = (type(value), value)
+                ret[i] = cache[key]
+                continue
+            except KeyError:
+                pass
+            except TypeError:
+                # lists can't be cached, so they are converted one at a time
+                key = None
+
+            try:
+                setter(scratch, value)
+            except ValueError as exc:
+                LOGGER.warning(str(exc))
+                converted = None
+            else:
+                converted = getattr(scratch, '_' + attr)
+
+            if key is not None:
+                cache[key] = converted
+
+            ret[i] = converted
+
+        return ret
 
     @classmethod
-    def from_page(cls, text: str):
+    def from_page(cls, text: str, lazy: bool = False):
         """
         Create an instance of ``ExchangeItem`` from the content of an exchange page,
         e.g. ``Exchange:Fire rune``.
 
         :param str text: The content of the module.
+        :param bool lazy: If ``True`` only convert values when they are accessed.
 
         :return ExchangeItem: An instance of ExchangeItem containing the data found in ``text``.
 
@@ -411,40 +821,39 @@ class ExchangeItem:
         # strip_any_whitespace
         text = text.strip()
 
+        # each of these is only run if the page contains what it removes
         # remove noincludes
-        text = re.sub(r'<noinclude>[\s\S]*?</noinclude>', '', text, flags=re.MULTILINE)
+        if '<noinclude>' in text:
+            text = _NOINCLUDE_RE.sub('', text)
         # remove categories
-        text = re.sub(r'\[\[Category:.+?\]\]', '', text)
+        if '[[Category:' in text:
+            text = _CATEGORY_RE.sub('', text)
         # remove default sort
-        text = re.sub(r'\{\{DEFAULTSORT:.+?\}\}', '', text)
+        if '{{DEFAULTSORT:' in text:
+            text = _DEFAULTSORT_RE.sub('', text)
         # remove comments
-        text = re.sub(r'<!--[\s\S]*?-->', '', text, flags=re.MULTILINE)
+        if '<!--' in text:
+            text = _COMMENT_RE.sub('', text)
         # strip_any_whitespace_again
         text = text.strip()
 
-        attrs = {}
+        params = _find_exchange_template_params(text)
 
-        wikicode = mwparserfromhell.parse(text)
-        templates = wikicode.filter_templates()
+        if params is None:
+            params = _parse_exchange_template_params(text)
 
-        for template in templates:
-            if template.name.strip() == 'ExchangeItem':
-                break
-        else:
-            raise ExchangeTemplateMissingError()
+        attrs = {}
 
-        for param in template.params:
-            name = str(param.name).strip()
+        for name, value in params:
+            name = name.strip()
 
             if name.isdigit():
                 continue
 
-            name = camelcase_to_snakecase(str(param.name).strip())
-            value = re.sub('<!--.*?-->', '', str(param.value), flags=re.MULTILINE)
-
+            name = _normalise_key(name)[0]
             attrs[name] = value.strip()
 
-        return cls(allow_category_nil=True, **attrs)
+        return cls(allow_category_nil=True, lazy=lazy, **attrs)
 
     @property
     def item_id(self) -> int:
@@ -721,35 +1130,24 @@ class ExchangeItem:
         """
         if isinstance(value, ExchangeCategory):
             self._category = value
+        elif value is None:
+            # nil in a module
+            self._category = ExchangeCategory.UNKNOWN
+        elif not isinstance(value, str):
+            msg = 'Unexpected value for {!r}: {!r}'.format('category', value)
+            raise ValueError(msg)
         else:
-            new_value = value \
-                .replace(' - ', '_') \
-                .replace(',', '') \
-                .replace(' ', '_') \
-                .upper()
+            category, corrected = _find_category(value)
 
-            try:
-                self._category = getattr(ExchangeCategory, new_value)
-            except AttributeError as exc:
-                if new_value.startswith('JEWEL'):
-                    # handle quirky spellings of jewellery
-                    self._category = ExchangeCategory.JEWELLERY
-                    LOGGER.warning('%s category was corrected from %r to %r',
-                                   self.item, value, self._category)
-
-                elif new_value.startswith('HERBS'):
-                    # a couple of odd instances of this
-                    self._category = ExchangeCategory.HERBLORE_MATERIALS
-                    LOGGER.warning('%s category was corrected from %r to %r',
-                                   self.item, value, self._category)
-
-                elif new_value == 'FLATPACKS':
-                    # old name for construction products
-                    self._category = ExchangeCategory.CONSTRUCTION_PRODUCTS
+            if category is None:
+                msg = 'Unexpected value for {!r}: {!r}'.format('category', value)
+                raise ValueError(msg)
 
-                else:
-                    msg = 'Unexpected value for {!r}: {!r}'.format('category', value)
-                    raise ValueError(msg)
+            self._category = category
+
+            if corrected:
+                LOGGER.warning('%s category was corrected from %r to %r',
+                               self.item, value, self._category)
 
     @property
     def alchable(self) -> bool:
@@ -820,6 +1218,90 @@ def camelcase_to_snakecase(value: str) -> str:
     return _ALL_CAP_RE.sub(r'\1_\2', s1).lower()
 
 
+def _normalise_key(key: str) -> tuple:
+    """
+    Find the attribute set by a key of an exchange module or page, or an argument of
+    ``ExchangeItem``.
+
+    :return tuple: The key in snake case, and the attribute it sets, ``''`` if it is ignored, or
+        ``None`` if it is unknown. Keys that aren't strings, e.g. the index of a positional value
+        in a module, are ignored.
+    """
+    try:
+        return _KEYS[key]
+    except KeyError:
+        pass
+
+    if not isinstance(key, str):
+        return str(key), ''
+
+    name = camelcase_to_snakecase(key)
+    mapped = _MAP_ATTRS.get(name, name)
+
+    if mapped in ExchangeItem._ATTRS:
+        attr = mapped
+    elif mapped in ExchangeItem._IGNORED_ATTRS:
+        attr = ''
+    else:
+        attr = None
+
+    ret = _KEYS[key] = (name, attr)
+
+    return ret
+
+
+def _module_attrs(data: dict) -> dict:
+    """
+    Convert the fields parsed from an exchange module to arguments of ``ExchangeItem``.
+
+    Positional values, which are keyed by their index, don't set anything so are dropped.
+    """
+    return {_normalise_key(k)[0]: v for k, v in data.items() if isinstance(k, str)}
+
+
+def _found_unknown_attr(name: str, value):
+    """
+    Count an unknown attribute for ``report_unknown_attrs``.
+    """
+    _UNKNOWN_ATTRS[name] += 1
+    LOGGER.debug('Unknown attribute found: name=%s, value=%r', name, value)
+
+
+def take_unknown_attrs() -> Counter:
+    """
+    Get the number of times each unknown attribute has been found since the last call, i.e. keys
+    of exchange modules or pages that are neither used nor deliberately ignored.
+
+    :return Counter: The counts, keyed by the attribute name in snake case.
+    """
+    ret = Counter(_UNKNOWN_ATTRS)
+    _UNKNOWN_ATTRS.clear()
+
+    return ret
+
+
+def report_unknown_attrs(counts: Counter, limit: int = 20) -> str:
+    """
+    Summarise the unknown attributes found in a run.
+
+    :param Counter counts: The counts, as returned by ``take_unknown_attrs``.
+    :param int limit: The number of the most common attributes to list.
+
+    :rtype: str
+    """
+    if not counts:
+        return 'No unknown attributes found'
+
+    common = ', '.join('{} ({})'.format(k, v) for k, v in counts.most_common(limit))
+    ret = 'Found {} unknown attributes {} times: {}'.format(len(counts), sum(counts.values()),
+                                                            common)
+
+    if len(counts) > limit:
+        ret += ', ...'
+
+    return ret
+
+
 def snakecase_to_camelcase(value: str) -> str:
     """
     """
@@ -834,6 +1316,319 @@ def snakecase_to_camelcase(value: str) -> str:
     return ''.join(parts)
 
 
+# seed _KEYS with the known keys, both as arguments and as written in modules
+for _key in ExchangeItem._ATTRS + ExchangeItem._IGNORED_ATTRS + tuple(_MAP_ATTRS):
+    _normalise_key(_key)
+    _normalise_key(snakecase_to_camelcase(_key))
+
+del _key
+
+
+def _find_exchange_template_params(text: str) -> list:
+    """
+    Find the parameters of the ``ExchangeItem`` template in a page without parsing the whole
+    page.
+
+    The template is found by searching for its name and its end by counting braces. Templates
+    that only contain nested links and templates are split directly, otherwise only the template
+    is given to mwparserfromhell.
+
+    :param str text: The cleaned up content of the page.
+
+    :return list: A list of ``(name, value)`` tuples, with positional parameters named by their
+        position, or ``None`` if the template couldn't be found this way.
+    """
+    # templates inside these aren't templates
+    if '<nowiki' in text or '<pre' in text:
+        return None
+
+    match = _EXCHANGE_TEMPLATE_RE.search(text)
+
+    if match is None or text[match.start() - 1:match.start()] == '{':
+        return None
+
+    start = match.start()
+    depth = 0
+
+    for brace in _BRACES_RE.finditer(text, start):
+        depth += 1 if brace.group() == '{{' else -1
+
+        if depth == 0:
+            end = brace.end()
+            break
+    else:
+        return None
+
+    body = text[match.end():end - 2]
+    params = _split_template_body(body)
+
+    if params is None:
+        # an unclosed link can hide the braces we counted, leave it to the full parse
+        depth = 0
+
+        for link in _LINKS_RE.finditer(body):
+            depth += 1 if link.group() == '[[' else -1
+
+            if depth < 0:
+                return None
+
+        if depth != 0:
+            return None
+
+        templates = mwparserfromhell.parse(text[start:end]).filter_templates(recursive=False)
+
+        # something odd like a template spanning the end, leave it to the full parse
+        if len(templates) != 1 or str(templates[0]) != text[start:end]:
+            return None
+
+        return [(str(p.name), _VALUE_COMMENT_RE.sub('', str(p.value))) for p in templates[0].params]
+
+    return params
+
+
+def _split_template_body(body: str) -> list:
+    """
+    Split the parameters of a template on the ``|`` and ``=`` that aren't inside a nested link or
+    template.
+
+    :param str body: The template, without the name and braces, i.e. starting at the first ``|``.
+
+    :return list: A list of ``(name, value)`` tuples, with positional parameters named by their
+        position, or ``None`` if the template contains other markup that needs mwparserfromhell.
+    """
+    ret = []
+    stack = []
+    position = 0
+    # the start of the current parameter and the position of its =, if any
+    param_start = None
+    equals = None
+
+    for token in _TEMPLATE_TOKENS_RE.finditer(body + '|'):
+        text = token.group()
+
+        if text in _NESTED_CLOSE:
+            if not stack or stack[-1][0] != _NESTED_CLOSE[text]:
+                return None
+
+            opened, opened_at = stack.pop()
+
+            # links can't span lines, leave them to mwparserfromhell
+            if opened == '[[' and '\n' in body[opened_at:token.start()]:
+                return None
+
+        elif text in _NESTED_CLOSE.values():
+            stack.append((text, token.start()))
+
+        elif stack:
+            # separators inside a link or template
+            if text not in '|=':
+                return None
+
+        elif text == '=':
+            if equals is None:
+                equals = token.start()
+
+        elif text == '|':
+            if param_start is not None:
+                if equals is None:
+                    position += 1
+                    ret.append((str(position), body[param_start:token.start()]))
+                else:
+                    ret.append((body[param_start:equals], body[equals + 1:token.start()]))
+
+            param_start = token.end()
+            equals = None
+
+        else:
+            return None
+
+    if stack:
+        return None
+
+    return ret
+
+
+def _parse_exchange_template_params(text: str) -> list:
+    """
+    Find the parameters of the ``ExchangeItem`` template by parsing the whole page.
+
+    :param str text: The cleaned up content of the page.
+
+    :return list: A list of ``(name, value)`` tuples.
+
+    :raises ExchangeTemplateMissingError: If the template isn't in the page.
+    """
+    wikicode = mwparserfromhell.parse(text)
+    templates = wikicode.filter_templates()
+
+    for template in templates:
+        if template.name.strip() == 'ExchangeItem':
+            break
+    else:
+        raise ExchangeTemplateMissingError()
+
+    return [(str(p.name), _VALUE_COMMENT_RE.sub('', str(p.value))) for p in template.params]
+
+
+def _lua_string(value: str) -> str:
+    """
+    Quote a string as a Lua string literal.
+    """
+    return "'" + value.translate(_LUA_ESCAPES) + "'"
+
+
+def _lua_table(values: list) -> str:
+    """
+    Format a list of strings as a Lua table, as used for ``usage``.
+    """
+    if not values:
+        return '{}'
+
+    return '{\n' + ',\n'.join(' ' * 8 + _lua_string(v) for v in values) + '\n    }'
+
+
+def _lua_key(key) -> str:
+    """
+    Format the key of a field in a Lua table.
+    """
+    if isinstance(key, str) and _LUA_NAME_RE.fullmatch(key) and key not in _LUA_KEYWORDS:
+        return key
+
+    return '[' + _lua_value(key) + ']'
+
+
+def _lua_value(value) -> str:
+    """
+    Format any value returned by ``ExchangeModuleParser`` as Lua.
+    """
+    if value is None:
+        return 'nil'
+
+    if isinstance(value, bool):
+        return _format_bool(value)
+
+    if isinstance(value, int):
+        return str(value)
+
+    if isinstance(value, float):
+        # inf isn't a literal, but it's what an out of range number is read as
+        return repr(value) if math.isfinite(value) else '-1e999' if value < 0 else '1e999'
+
+    if isinstance(value, str):
+        return _lua_string(value)
+
+    if isinstance(value, list):
+        return '{' + ', '.join(_lua_value(v) for v in value) + '}'
+
+    return '{' + ', '.join(_lua_key(k) + ' = ' + _lua_value(v) for k, v in value.items()) + '}'
+
+
+def _lua_category(value: ExchangeCategory) -> str:
+    """
+    """
+    if value is ExchangeCategory.UNKNOWN:
+        return 'nil'
+
+    return _lua_string(value.to_name())
+
+
+def _csv_category(value: ExchangeCategory) -> str:
+    """
+    """
+    return '' if value is ExchangeCategory.UNKNOWN else str(value.value)
+
+
+@lru_cache(maxsize=65536)
+def _format_datetime(value: datetime, fmt: str) -> str:
+    """
+    Cached ``strftime``, as the same dates are repeated across the revisions of a module.
+    """
+    return value.strftime(fmt)
+
+
+def _format_bool(value: bool) -> str:
+    """
+    """
+    return 'true' if value else 'false'
+
+
+# how each kind of attribute is formatted by to_module, to_csv and to_csv_row
+# None values are written as the entry in _NONE_VALUES instead
+_FORMATTERS = {
+    'module': {'str': _lua_string,
+               'int': str,
+               'float': repr,
+               'datetime': lambda v: _lua_string(_format_datetime(v, _DATETIME_FMTS[0])),
+               'bool': _format_bool,
+               'category': _lua_category,
+               'list': _lua_table},
+    'csv': {'str': repr,
+            'int': str,
+            'float': str,
+            'datetime': lambda v: repr(_format_datetime(v, _SQL_FMT)),
+            'bool': _format_bool,
+            'category': _csv_category,
+            'list': str},
+    'csv_row': {'str': None,
+                'int': None,
+                'float': None,
+                'datetime': lambda v: _format_datetime(v, _SQL_FMT),
+                'bool': _format_bool,
+                'category': lambda v: '' if v is ExchangeCategory.UNKNOWN else v.value,
+                'list': '\n'.join},
+}
+_NONE_VALUES = {'module': 'nil', 'csv': '', 'csv_row': ''}
+
+
+@lru_cache(maxsize=None)
+def _field_plan(cls, fmt: str) -> tuple:
+    """
+    Work out how to format the attributes of ``cls`` for ``fmt``, one of the keys of
+    ``_FORMATTERS``.
+
+    This is only done once per class and format, rather than once per attribute per call.
+
+    :return tuple: A getter returning the values of every attribute, the value written for
+        ``None`` and a tuple of ``(key, formatter)`` for each attribute, where the key is the
+        name used in modules and the formatter is ``None`` if the value is written as is.
+    """
+    formatters = _FORMATTERS[fmt]
+    fields = tuple((snakecase_to_camelcase(attr), formatters[_ATTR_KINDS[attr]])
+                   for attr in cls._ATTRS)
+
+    if issubclass(cls, ExchangeItem):
+        # skip the properties, values still pending in lazy mode are found by __getattr__
+        names = ['_' + attr for attr in cls._ATTRS]
+    else:
+        names = cls._ATTRS
+
+    return attrgetter(*names), _NONE_VALUES[fmt], fields
+
+
+def _format_fields(plan: tuple, item) -> list:
+    """
+    Format the values of ``item`` using a plan from ``_field_plan``.
+    """
+    getter, none, fields = plan
+
+    return [none if v is None else v if fmt is None else fmt(v)
+            for v, (_, fmt) in zip(getter(item), fields)]
+
+
+def _format_module(plan: tuple, item, extra: dict = None) -> str:
+    """
+    Format the values of ``item`` as an exchange module using a plan from ``_field_plan``,
+    followed by the fields in ``extra``.
+    """
+    values = _format_fields(plan, item)
+    lines = ['    {} = {}'.format(key, value) for (key, _), value in zip(plan[2], values)]
+
+    if extra:
+        lines.extend('    {} = {}'.format(_lua_key(k), _lua_value(v)) for k, v in extra.items())
+
+    return 'return {\n' + ',\n'.join(lines) + '\n}\n'
+
+
 def convert_to_bool(name: str, value) -> bool:
     """
     Convert a value to it's ``bool`` equivalent.
@@ -848,7 +1643,8 @@ def convert_to_bool(name: str, value) -> bool:
     * no
     * false
 
-    Both sets of strings are case insensitive.
+    Both sets of strings are case insensitive. ``None``, ``nil`` and empty strings are converted to
+    ``None``.
 
     :param str name: The name of the attribute being converted. Used in error messages.
     :param value: The value to convert.
@@ -857,12 +1653,16 @@ def convert_to_bool(name: str, value) -> bool:
 
     :raises ValueError: If ``value`` could not be converted to a ``bool``.
     """
-    if isinstance(value, bool):
+    if isinstance(value, bool) or value is None:
         return value
 
+    if not isinstance(value, str):
+        msg = 'Unable to convert {!r} to boolean: {!r}'.format(name, value)
+        raise ValueError(msg)
+
     value = value.strip().lower()
 
-    if value == '' or value is None or value == 'nil':
+    if value == '' or value == 'nil':
         return None
 
     if value in ('true', 'yes'):
@@ -879,6 +1679,8 @@ def convert_to_int(name: str, value, min_value: int = None) -> int:
     """
     Converts a value to an integer.
 
+    Strings are classified by a single match of ``_INT_RE``, see there for the forms handled.
+
     :param str name: The name of the attribute being converted. Used in error messages.
     :param value: The value to convert.
 
@@ -886,10 +1688,22 @@ def convert_to_int(name: str, value, min_value: int = None) -> int:
 
     :raises ValueError: If ``value`` could not be converted to an ``int``.
     """
+    if isinstance(value, float):
+        # numbers in modules are parsed as floats if they have a decimal point
+        if not value.is_integer():
+            msg = '{!r} could not be converted to an integer: {!r}.'.format(name, value)
+            raise ValueError(msg)
+
+        value = int(value)
+
     if not isinstance(value, int):
         if value == 'nil' or value == '' or value is None:
             return None
 
+        if not isinstance(value, str):
+            msg = '{!r} could not be converted to an integer: {!r}.'.format(name, value)
+            raise ValueError(msg)
+
         # strip commas
         value = value.replace(',', '')
         # rm trailing gp/coins
@@ -900,63 +1714,36 @@ def convert_to_int(name: str, value, min_value: int = None) -> int:
         # rm any leftover whitespace
         value = value.strip()
 
+        match = _INT_RE.match(value)
+        kind = match.lastgroup
+
         # if it's just text, it's almost always vandalism, so just ignore it
-        if re.match(r'\A\D+\Z', value, flags=re.ASCII):
+        if kind == 'text':
             return None
 
-        # handle "1 000 000"
-        if re.match(r'\A[\d ]+\Z', value):
-            value = value.replace(' ', '')
-
-        # handle "1.000.000"
-        if re.match(r'\A[\d\.]+\Z', value):
-            value = value.replace('.', '')
-
-        # handle ranges
-        if re.match(r'\A\d+\s*-\s*\d+\Z', value):
-            parts = value.split('-')
-            value = int((convert_to_int(name, parts[0].strip(), min_value) +
-                         convert_to_int(name, parts[1].strip(), min_value)) / 2)
-
-            return value
-
-        # handle ranges with "to" as the separator
-        if re.match(r'\A\d+\s+to\s+\d+\Z', value):
-            parts = value.split('to')
-            value = int((convert_to_int(name, parts[0].strip(), min_value) +
-                         convert_to_int(name, parts[1].strip(), min_value)) / 2)
+        try:
+            if kind == 'spaced':
+                value = int(value.replace(' ', ''))
 
-            return value
+            elif kind == 'dotted':
+                value = int(value.replace('.', ''))
 
-        try:
-            # handle modifiers: k, m, etc.
-            if value.endswith('k'):
-                if '.' in value:
-                    value = int(convert_to_float(name, value[:-1]) * 1000)
-                else:
-                    value = int(value[:-1])
-                    value *= 1000
+            elif kind == 'range':
+                low = int(match.group('low'))
+                high = int(match.group('high'))
+                # the mean is used, but it's each end that has to be at least min_value
+                value = min(low, high)
 
-            elif value.endswith('m'):
-                if '.' in value:
-                    value = int(convert_to_float(name, value[:-1]) * 1000000)
-                else:
-                    value = int(value[:-1])
-                    value *= 1000000
+                if min_value is None or value >= min_value:
+                    return int((low + high) / 2)
 
-            elif value.endswith('mil'):
-                if '.' in value:
-                    value = int(convert_to_float(name, value[:-3]) * 1000000)
-                else:
-                    value = int(value[:-3])
-                    value *= 1000000
+            elif kind == 'suffix':
+                number = match.group('number')
 
-            elif value.endswith('mill'):
                 if '.' in value:
-                    value = int(convert_to_float(name, value[:-4]) * 1000000)
+                    value = int(float(number) * _INT_SUFFIXES[match.group(kind)])
                 else:
-                    value = int(value[:-4])
-                    value *= 1000000
+                    value = int(number) * _INT_SUFFIXES[match.group(kind)]
 
             else:
                 value = int(value)
@@ -982,6 +1769,16 @@ def convert_to_float(name: str, value, min_value: float = None) -> float:
 
     :raises ValueError: If ``value`` could not be converted to a ``float``.
     """
+    if value == 'nil' or value == '' or value is None:
+        return None
+
+    if isinstance(value, int) and not isinstance(value, bool):
+        value = float(value)
+
+    if not isinstance(value, (float, str)):
+        msg = '{!r} could not be converted to a float: {!r}.'.format(name, value)
+        raise ValueError(msg)
+
     if not isinstance(value, float):
         try:
             # strip commas
@@ -1002,6 +1799,9 @@ def convert_to_datetime(name: str, value) -> datetime:
     """
     Converts a value to a datetime object.
 
+    The same dates appear in many revisions of a module or page, so strings are converted by a
+    cached helper, see ``_parse_datetime``.
+
     :param str name: The name of the attribute being converted. Used in error messages.
     :param value: The value to convert.
 
@@ -1012,15 +1812,42 @@ def convert_to_datetime(name: str, value) -> datetime:
     if isinstance(value, datetime):
         return value
 
+    if value is None:
+        return None
+
+    if not isinstance(value, str):
+        msg = '{!r} could not be converted to a datetime: {!r}.'.format(name, value)
+        raise ValueError(msg)
+
+    ret = _parse_datetime(value)
+
+    # failures are returned rather than raised so they are cached too
+    if isinstance(ret, str):
+        msg = '{!r} could not be converted to a datetime: {!r}.'.format(name, ret)
+        raise ValueError(msg)
+
+    return ret
+
+
+@lru_cache(maxsize=65536)
+def _parse_datetime(value: str):
+    """
+    Converts a string to a datetime object.
+
+    :param str value: The value to convert.
+
+    :return: The converted value, ``None`` if ``value`` is empty or the cleaned up value if it
+        could not be converted.
+    """
     # nil is if it was set to that in lua
     # undefined probably came from JS
-    if value is None or value == 'nil' or value =='undefined':
+    if value == 'nil' or value =='undefined':
         return None
 
     # handle cases where someone used ~~~~ instead of ~~~~~
     # when manually setting a date
-    value = re.sub(r'\[\[.*?\]\]', '', value)
-    value = re.sub(r'\{\{.*?\}\}', '', value)
+    value = _WIKILINK_RE.sub('', value)
+    value = _TEMPLATE_RE.sub('', value)
 
     # and cases where the tilde didn't expand for some reason
     value = value.replace('~', '')
@@ -1036,21 +1863,28 @@ def convert_to_datetime(name: str, value) -> datetime:
 
     # correct cases where we have something like "1:15" as the time
     # arguably this could be 1am or 1pm, but such things are pretty old and better than nothing
-    if value[1] == ':':
+    if value[1:2] == ':':
         value = '0' + value
 
     for k, v in _DATETIME_REPLACEMENTS.items():
         value = value.replace(k, v)
 
-    for fmt in _DATETIME_FMTS:
+    for i, fmt in enumerate(_datetime_fmts):
         try:
             ret = datetime.strptime(value, fmt)
             break
         except ValueError:
             pass
     else:
-        msg = '{!r} could not be converted to a datetime: {!r}.'.format(name, value)
-        raise ValueError(msg)
+        return value
+
+    # keep the formats ordered by how often they're used
+    # so the common ones are tried first
+    _datetime_fmt_hits[fmt] += 1
+
+    while i > 0 and _datetime_fmt_hits[_datetime_fmts[i - 1]] < _datetime_fmt_hits[fmt]:
+        _datetime_fmts[i - 1], _datetime_fmts[i] = fmt, _datetime_fmts[i - 1]
+        i -= 1
 
     for k, v in _TIMEZONES.items():
         if '({})'.format(k) in value:
@@ -5,10 +5,14 @@
 
 from enum import Enum, unique
 import logging
-import string
+import re
+
+
+__all__ = ['ExchangeModuleToken', 'ExchangeModuleParser', 'ExchangeModuleLexer', 'parse_fields']
 
 LOGGER = logging.getLogger(__name__)
 
+
 @unique
 class ExchangeModuleToken(Enum):
     """
@@ -22,6 +26,13 @@ class ExchangeModuleToken(Enum):
     STRING = 6
     IDENTIFIER = 7
     ASSIGN = 8
+    SEMICOLON = 9
+    LEFT_BRACKET = 10
+    RIGHT_BRACKET = 11
+    MINUS = 12
+    NIL = 13
+    TRUE = 14
+    FALSE = 15
 
 
 _SINGLE_CHAR_TOKENS = {
@@ -29,15 +40,104 @@ _SINGLE_CHAR_TOKENS = {
     '}': ExchangeModuleToken.RIGHT_BRACE,
     ',': ExchangeModuleToken.COMMA,
     '=': ExchangeModuleToken.ASSIGN,
+    ';': ExchangeModuleToken.SEMICOLON,
+    '[': ExchangeModuleToken.LEFT_BRACKET,
+    ']': ExchangeModuleToken.RIGHT_BRACKET,
+    '-': ExchangeModuleToken.MINUS,
 }
 
 _KEYWORDS = {
     'return': ExchangeModuleToken.RETURN,
+    'nil': ExchangeModuleToken.NIL,
+    'true': ExchangeModuleToken.TRUE,
+    'false': ExchangeModuleToken.FALSE,
+}
+
+_CONSTANTS = {
+    ExchangeModuleToken.NIL: None,
+    ExchangeModuleToken.TRUE: True,
+    ExchangeModuleToken.FALSE: False,
+}
+
+# the token for each group of _TOKEN_RE that always produces the same kind of token
+# single character tokens are looked up in _SINGLE_CHAR_TOKENS
+_GROUP_TOKENS = {
+    'lbrace': ExchangeModuleToken.LEFT_BRACE,
+    'rbrace': ExchangeModuleToken.RIGHT_BRACE,
+    'comma': ExchangeModuleToken.COMMA,
+    'assign': ExchangeModuleToken.ASSIGN,
+    'string': ExchangeModuleToken.STRING,
+    'long_string': ExchangeModuleToken.STRING,
+    'hex': ExchangeModuleToken.INTEGER,
+    'float': ExchangeModuleToken.FLOAT,
+    'integer': ExchangeModuleToken.INTEGER,
+    'identifier': ExchangeModuleToken.IDENTIFIER,
 }
+_GROUP_TOKENS.update(('kw_' + k, v) for k, v in _KEYWORDS.items())
+
+# every token, tried in order after skipping any whitespace and comments
+# the most common punctuation and keywords have their own groups so the kind of token is known
+# without looking at the matched text
+# strings that aren't closed are caught by unclosed, and anything else by unexpected
+_TOKEN_RE = re.compile(r'''
+    [ \t\n\r\x0b\x0c]*
+    (?:
+        --(?:\[(?P<comment_level>=*)\[.*?\](?P=comment_level)\]|[^\n]*)
+        [ \t\n\r\x0b\x0c]*
+    )*
+    (?:
+        (?P<lbrace>\{)
+      | (?P<rbrace>\})
+      | (?P<comma>,)
+      | (?P<assign>=)
+      | (?P<string>'(?:\\.|[^'\\])*'|"(?:\\.|[^"\\])*")
+      | (?P<kw_return>return\b)
+      | (?P<kw_nil>nil\b)
+      | (?P<kw_true>true\b)
+      | (?P<kw_false>false\b)
+      | (?P<identifier>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<hex>0[xX][0-9a-fA-F]+)
+      | (?P<float>(?:[0-9]+\.[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?|[0-9]+[eE][+-]?[0-9]+)
+      | (?P<integer>[0-9]+)
+      | (?P<long_string>\[(?P<string_level>=*)\[.*?\](?P=string_level)\])
+      | (?P<unclosed>['"]|\[=*\[)
+      | (?P<single>[;\[\]-])
+      | (?P<end>\Z)
+      | (?P<unexpected>.)
+    )
+''', re.VERBOSE | re.DOTALL)
+_ESCAPE_RE = re.compile(r'''
+    \\(?:
+        (?P<char>[abfnrtv\\"'\n])
+      | (?P<skip>z\s*)
+      | x(?P<hex>[0-9A-Fa-f]{2})
+      | (?P<decimal>[0-9]{1,3})
+      | u\{(?P<unicode>[0-9A-Fa-f]+)\}
+      | (?P<other>.)
+    )
+''', re.VERBOSE | re.DOTALL)
+_ESCAPES = {'a': '\a', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v',
+            '\\': '\\', '"': '"', "'": "'", '\n': '\n'}
 
 
 class ExchangeModuleParser:
     """
+    A recursive descent parser for the subset of Lua used by exchange modules, i.e. a single
+    returned table of data.
+
+    Tables may be nested, such as the ``usage`` list, and fields may be separated by ``,`` or
+    ``;``. Keys may be names or ``[expression]``. Values are converted to their Python
+    equivalent:
+
+    * ``nil``, ``true`` and ``false`` to ``None``, ``True`` and ``False``
+    * integers, including negative and hexadecimal integers, to ``int``
+    * other numbers to ``float``
+    * strings, including long strings, to ``str`` with any escapes resolved
+    * tables to a ``list`` if every value is positional, otherwise a ``dict``, with positional
+      values keyed from 1
+
+    Tokens are read as spans of the content, so the text of a token is only sliced out when its
+    value is needed.
     """
 
     def __init__(self, content: str):
@@ -45,213 +145,420 @@ class ExchangeModuleParser:
         """
         self.content = content
 
+        self._lexer = ExchangeModuleLexer(content)
+        self._spans = None
+        self.token = None
+        self.start = 0
+        self.end = 0
+
     def parse(self) -> dict:
         """
+        Parse the content.
+
+        :return dict: The fields of the returned table.
+
+        :raises ValueError: If the content is not a single table of named fields.
         """
-        ret = {}
-        lexer = ExchangeModuleLexer(self.content)
-        tokeniser = lexer.tokenise()
-        table_level = 0
+        self.start_table()
+        ret = self.parse_table()
+
+        if self.token == ExchangeModuleToken.SEMICOLON:
+            self.next_token()
+
+        if self.token is not None:
+            self.unexpected()
+
+        if isinstance(ret, list):
+            if ret:
+                raise ValueError('Expected a table of named fields')
 
-        for token, value in tokeniser:
-            if token == ExchangeModuleToken.RETURN:
-                continue
+            ret = {}
 
-            if token == ExchangeModuleToken.LEFT_BRACE:
-                table_level += 1
-                continue
+        return ret
 
-            if token == ExchangeModuleToken.RIGHT_BRACE:
-                table_level -= 1
-                continue
+    def parse_fields(self, wanted) -> dict:
+        """
+        Parse only the named fields in ``wanted``, stopping as soon as they have all been found.
 
-            if token == ExchangeModuleToken.COMMA:
-                continue
+        The values of other fields are skipped without being converted and anything after the
+        last wanted field is not read, so errors there are not raised. If a field is repeated, the
+        first value is used.
 
-            if token == ExchangeModuleToken.IDENTIFIER:
-                key = value
-                token, value = next(tokeniser)
+        :param wanted: An iterable of the field names to parse, e.g. ``('price', 'date')``.
 
-                if token != ExchangeModuleToken.ASSIGN:
-                    raise ValueError('Unexpected token: {}. Expected {}.'
-                                     .format(token, ExchangeModuleToken.ASSIGN))
+        :return dict: The found fields. Fields that aren't in the content are missing.
 
-                token, value = next(tokeniser)
+        :raises ValueError: If the content is invalid before all the fields are found.
+        """
+        wanted = set(wanted)
+        ret = {}
 
-                if token == ExchangeModuleToken.LEFT_BRACE:
-                    raise NotImplementedError('Nested tables not implemented')
+        self.start_table()
+        self.expect(ExchangeModuleToken.LEFT_BRACE)
 
-                ret[key] = value
+        while wanted and self.token != ExchangeModuleToken.RIGHT_BRACE:
+            key = self.parse_key()
 
-        if table_level != 0:
-            raise ValueError('Unclosed table')
+            if key in wanted:
+                ret[key] = self.parse_value()
+                wanted.discard(key)
+            else:
+                self.skip_value()
+
+            self.next_field()
 
         return ret
 
+    def start_table(self):
+        """
+        Start reading the content, moving to the ``{`` of the returned table.
+        """
+        self._spans = self._lexer.spans()
+        self.next_token()
+
+        if self.token == ExchangeModuleToken.RETURN:
+            self.next_token()
 
-class ExchangeModuleLexer:
-    """
-    """
+        if self.token != ExchangeModuleToken.LEFT_BRACE:
+            self.unexpected(ExchangeModuleToken.LEFT_BRACE)
 
-    def __init__(self, content: str):
+    def next_token(self):
         """
+        Move on to the next token, setting ``token``, ``start`` and ``end``. ``token`` is ``None``
+        at the end of the content.
         """
-        self.content = content
+        self.token, self.start, self.end = next(self._spans, (None, self.end, self.end))
 
-        self.index = 0
-        self.char = None
+    def text(self) -> str:
+        """
+        Get the text of the current token.
 
-        self.line = 1
-        self.column = 0
+        :rtype: str
+        """
+        return self.content[self.start:self.end]
 
-    def next_char(self):
+    def expect(self, token: ExchangeModuleToken):
         """
+        Move past the current token, which must be ``token``.
+
+        :raises ValueError: If the current token is not ``token``.
         """
-        if self.char is not None:
-            self.index += 1
+        if self.token != token:
+            self.unexpected(token)
 
-        try:
-            self.char = self.content[self.index]
-        except IndexError:
-            self.char = None
-            return self.char
+        self.next_token()
+
+    def unexpected(self, expected: ExchangeModuleToken = None):
+        """
+        :raises ValueError: Always, for the current token.
+        """
+        if self.token is None:
+            if expected == ExchangeModuleToken.RIGHT_BRACE:
+                raise ValueError('Unclosed table')
 
-        if self.char == '\n':
-            self.line += 1
-            self.column = 0
+            msg = 'Unexpected end of content.'
         else:
-            self.column += 1
+            self._lexer.index = self.start
+            msg = 'Unexpected token: {} at line: {}, column: {}.'.format(
+                self.token, self._lexer.line, self._lexer.column)
 
-        return self.char
+        if expected is not None:
+            msg += ' Expected {}.'.format(expected)
 
-    def peek_char(self) -> str:
+        raise ValueError(msg)
+
+    def parse_key(self):
         """
+        Parse the key of a field, up to and including the ``=``.
+
+        :return: The key, or ``None`` if the field is positional.
         """
-        if self.char is None:
-            return None
+        if self.token == ExchangeModuleToken.IDENTIFIER:
+            key = self.text()
+            self.next_token()
+            self.expect(ExchangeModuleToken.ASSIGN)
 
-        try:
-            return self.content[self.index + 1]
-        except IndexError:
-            return None
+            return key
 
+        if self.token == ExchangeModuleToken.LEFT_BRACKET:
+            self.next_token()
+            key = self.parse_value()
+            self.expect(ExchangeModuleToken.RIGHT_BRACKET)
+            self.expect(ExchangeModuleToken.ASSIGN)
 
-    def tokenise(self):
+            return key
+
+        if self.token is None:
+            self.unexpected(ExchangeModuleToken.RIGHT_BRACE)
+
+        return None
+
+    def next_field(self):
+        """
+        Move past the separator after a field, if any.
         """
+        if self.token in (ExchangeModuleToken.COMMA, ExchangeModuleToken.SEMICOLON):
+            self.next_token()
+        elif self.token != ExchangeModuleToken.RIGHT_BRACE:
+            self.unexpected(ExchangeModuleToken.RIGHT_BRACE)
+
+    def parse_table(self):
         """
-        while self.next_char() is not None:
-            while self.char in string.whitespace:
-                self.next_char()
+        Parse a table constructor, starting at the ``{``.
 
-            if self.char in _SINGLE_CHAR_TOKENS:
-                yield _SINGLE_CHAR_TOKENS[self.char], None
+        :return: A ``list`` or ``dict``, see the class documentation.
+        """
+        self.expect(ExchangeModuleToken.LEFT_BRACE)
+        fields = {}
+        items = []
 
-            elif self.char == '\'' or self.char == '"':
-                value = self.read_string()
-                yield ExchangeModuleToken.STRING, value
+        while self.token != ExchangeModuleToken.RIGHT_BRACE:
+            key = self.parse_key()
 
+            if key is None:
+                items.append(self.parse_value())
             else:
-                if self.char in string.digits:
-                    value = self.read_number()
+                fields[key] = self.parse_value()
 
-                    if '.' in value:
-                        yield ExchangeModuleToken.FLOAT, value
-                    else:
-                        yield ExchangeModuleToken.INTEGER, value
+            self.next_field()
 
-                elif self.char in string.ascii_letters:
-                    value = self.read_identifier()
+        self.next_token()
 
-                    if value in _KEYWORDS:
-                        yield _KEYWORDS[value], None
-                    else:
-                        yield ExchangeModuleToken.IDENTIFIER, value
+        if not fields:
+            return items
 
-                else:
-                    raise ValueError('Unexpected character: {!r} at line: {}, column: {}'
-                                     .format(self.char, self.line, self.column))
+        for i, item in enumerate(items, 1):
+            fields[i] = item
 
-    def read_number(self) -> str:
+        return fields
+
+    def parse_value(self):
         """
+        Parse a single value.
+
+        :return: The Python equivalent of the value.
         """
-        value = self.char
-        is_float = False
+        token = self.token
+
+        if token == ExchangeModuleToken.LEFT_BRACE:
+            return self.parse_table()
+
+        if token == ExchangeModuleToken.MINUS:
+            self.next_token()
+
+            if self.token not in (ExchangeModuleToken.INTEGER, ExchangeModuleToken.FLOAT):
+                self.unexpected(ExchangeModuleToken.INTEGER)
 
-        while True:
-            peek = self.peek_char()
+            return -self.parse_value()
 
-            if peek in string.digits:
-                value += self.next_char()
-                continue
+        if token in _CONSTANTS:
+            ret = _CONSTANTS[token]
 
-            if peek == '.':
-                if not is_float:
-                    is_float = True
-                    value += self.next_char()
-                    continue
-                else:
-                    self.next_char()
-                    raise ValueError('Unexpected character: {!r} at line: {}, column: {}'
-                                     .format(self.char, self.line, self.column))
+        elif token == ExchangeModuleToken.STRING:
+            ret = self._lexer.value(token, self.start, self.end)
 
-            break
+        elif token == ExchangeModuleToken.INTEGER:
+            text = self.text()
 
-        return value
+            if text[:2] in ('0x', '0X'):
+                ret = int(text, 16)
+            else:
+                ret = int(text)
+
+        elif token == ExchangeModuleToken.FLOAT:
+            ret = float(self.text())
+
+        else:
+            self.unexpected()
+
+        self.next_token()
+
+        return ret
 
-    def read_identifier(self) -> str:
+    def skip_value(self):
         """
+        Move past a single value without converting it.
         """
-        value = self.char
+        if self.token == ExchangeModuleToken.LEFT_BRACE:
+            depth = 0
 
-        while True:
-            peek = self.peek_char()
+            while True:
+                if self.token == ExchangeModuleToken.LEFT_BRACE:
+                    depth += 1
+                elif self.token == ExchangeModuleToken.RIGHT_BRACE:
+                    depth -= 1
+                elif self.token is None:
+                    self.unexpected(ExchangeModuleToken.RIGHT_BRACE)
 
-            if peek in string.digits or peek in string.ascii_letters or peek == '_':
-                value += self.next_char()
-                continue
+                self.next_token()
 
-            break
+                if depth == 0:
+                    return
 
-        return value
+        if self.token == ExchangeModuleToken.MINUS:
+            self.next_token()
 
-    def read_string(self) -> str:
+            if self.token not in (ExchangeModuleToken.INTEGER, ExchangeModuleToken.FLOAT):
+                self.unexpected(ExchangeModuleToken.INTEGER)
+
+        elif self.token not in _CONSTANTS and self.token not in (ExchangeModuleToken.STRING,
+                                                                 ExchangeModuleToken.INTEGER,
+                                                                 ExchangeModuleToken.FLOAT):
+            self.unexpected()
+
+        self.next_token()
+
+
+class ExchangeModuleLexer:
+    """
+    Splits the content of an exchange module into tokens.
+
+    This uses a single compiled regular expression, matching each token in one step rather than
+    walking the content a character at a time.
+    """
+
+    def __init__(self, content: str):
+        """
+        """
+        self.content = content
+        self.index = 0
+
+    @property
+    def line(self) -> int:
+        """
+        The line of the current position, starting from 1.
+
+        :rtype: int
+        """
+        return self.content.count('\n', 0, self.index) + 1
+
+    @property
+    def column(self) -> int:
+        """
+        The column of the current position, starting from 1.
+
+        :rtype: int
         """
+        return self.index - self.content.rfind('\n', 0, self.index)
+
+    def spans(self):
         """
-        open_quote = self.char
-        start_line = self.line
-        start_column = self.column
-        value = ''
+        Generator for the tokens found in the content, as spans of the content.
+
+        No text is copied out of the content, see ``value`` for getting the value of a token.
+
+        :return: A generator of ``(ExchangeModuleToken, start, end)`` tuples.
+
+        :raises ValueError: If an unexpected character or unclosed string is found.
+        """
+        group_tokens = _GROUP_TOKENS
+        content = self.content
+
+        for match in _TOKEN_RE.finditer(content):
+            kind = match.lastgroup
+
+            if kind in group_tokens:
+                yield group_tokens[kind], match.start(kind), match.end(kind)
 
-        while True:
-            peek = self.peek_char()
+            elif kind == 'single':
+                start = match.start(kind)
+                yield _SINGLE_CHAR_TOKENS[content[start]], start, start + 1
 
-            if peek == open_quote and self.char != '\\':
-                self.next_char()
+            elif kind == 'end':
                 break
 
-            if peek is not None:
-                value += self.next_char()
-                continue
+            elif kind == 'unclosed':
+                self.index = match.start(kind)
+                raise ValueError('Unclosed string started line: {}, column: {}'
+                                 .format(self.line, self.column))
 
-            raise ValueError('Unclosed string started line: {}, column: {}'
-                             .format(start_line, start_column))
+            else:
+                self.index = match.start(kind)
+                raise ValueError('Unexpected character: {!r} at line: {}, column: {}'
+                                 .format(match.group(kind), self.line, self.column))
 
-        return value
+    def value(self, token: ExchangeModuleToken, start: int, end: int) -> str:
+        """
+        Get the value of a token found by ``spans``.
 
+        :return str: The contents of a string, with any escapes resolved, or the text of a
+            number or identifier. ``None`` for other tokens.
+        """
+        if token == ExchangeModuleToken.STRING:
+            if self.content[start] == '[':
+                brackets = self.content.index('[', start + 1) - start + 1
+                value = self.content[start + brackets:end - brackets]
 
-def _is_ascii_digit(char: str) -> bool:
-    """
-    """
-    return 1
+                # a newline straight after the opening brackets is skipped
+                if value[:1] == '\n':
+                    value = value[1:]
+
+                return value
+
+            value = self.content[start + 1:end - 1]
+
+            if '\\' in value:
+                value = _unescape(value)
+
+            return value
+
+        if token in (ExchangeModuleToken.INTEGER, ExchangeModuleToken.FLOAT,
+                     ExchangeModuleToken.IDENTIFIER):
+            return self.content[start:end]
+
+        return None
+
+    def tokenise(self):
+        """
+        Generator for the tokens found in the content.
 
+        :return: A generator of ``(ExchangeModuleToken, value)`` tuples. ``value`` is ``None``
+            for tokens that are a single character or keyword.
 
-def _is_ascii_alphabetic(char: str) -> bool:
+        :raises ValueError: If an unexpected character or unclosed string is found.
+        """
+        for token, start, end in self.spans():
+            yield token, self.value(token, start, end)
+
+
+def parse_fields(text: str, wanted) -> dict:
     """
+    Parse selected fields from the content of an exchange module, e.g. to extract only prices.
+
+    See ``ExchangeModuleParser.parse_fields``.
+
+    :param str text: The content of the module.
+    :param wanted: An iterable of the field names to parse, as used in the module, e.g.
+        ``('price', 'date')``.
+
+    :return dict: The found fields.
     """
-    return char in string.ascii_letters
+    return ExchangeModuleParser(text).parse_fields(wanted)
 
 
-def _is_ascii_whitespace(char: str) -> bool:
+def _unescape(value: str) -> str:
     """
+    Resolve the escape sequences in a Lua string.
     """
-    return char in string.whitespace
+    def replace(match):
+        kind = match.lastgroup
+
+        if kind == 'char':
+            return _ESCAPES[match.group(kind)]
+
+        if kind == 'skip':
+            return ''
+
+        if kind == 'hex':
+            return chr(int(match.group(kind), 16))
+
+        if kind == 'decimal':
+            return chr(int(match.group(kind)))
+
+        if kind == 'unicode':
+            return chr(int(match.group(kind), 16))
+
+        # not valid lua, but keep the character rather than losing it
+        return match.group(kind)
+
+    return _ESCAPE_RE.sub(replace, value)
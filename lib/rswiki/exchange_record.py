@@ -0,0 +1,141 @@
+#
+
+"""
+A lightweight representation of an exchange item for bulk processing.
+"""
+
+from .exchange_item import _SQL_FMT, ExchangeCategory, ExchangeItem
+
+
+__all__ = ['ExchangeRecord']
+
+
+class ExchangeRecord:
+    """
+    The data of an ``ExchangeItem``, stored in slots without any validation.
+
+    ``ExchangeItem`` converts and validates every attribute as it is set, which isn't needed once
+    the data is known to be valid. Records are intended for holding large numbers of parsed
+    revisions, or sending them between processes, and can be used with the exchange writers and
+    ``dedupe_revisions`` in place of an ``ExchangeItem``.
+
+    Example::
+
+        record = ExchangeRecord.from_item(ExchangeItem.from_module(text))
+        item = record.to_item()
+    """
+
+    __slots__ = ExchangeItem._ATTRS
+    _ATTRS = ExchangeItem._ATTRS
+
+    def __init__(self, item: str = None, item_id: int = None, price: int = None,
+                 last: int = None, date=None, last_date=None, volume: float = None,
+                 volume_date=None, value: int = None, limit: int = None, members: bool = None,
+                 category: ExchangeCategory = ExchangeCategory.UNKNOWN, alchable: bool = False,
+                 examine: str = None, usage: list = None):
+        """
+        Create a new instance of ``ExchangeRecord``.
+
+        The arguments are the same as the attributes of ``ExchangeItem`` and must already be of
+        the correct type, as they are stored as is. The defaults match an empty
+        ``ExchangeItem``.
+        """
+        self.item = item
+        self.item_id = item_id
+        self.price = price
+        self.last = last
+        self.date = date
+        self.last_date = last_date
+        self.volume = volume
+        self.volume_date = volume_date
+        self.value = value
+        self.limit = limit
+        self.members = members
+        self.category = category
+        self.alchable = alchable
+        self.examine = examine
+        self.usage = usage
+
+    def __repr__(self) -> str:
+        """
+        """
+        values = ('{}={!r}'.format(attr, getattr(self, attr)) for attr in self._ATTRS)
+
+        return '{}({})'.format(self.__class__.__name__, ', '.join(values))
+
+    def __eq__(self, other) -> bool:
+        """
+        """
+        if not isinstance(other, ExchangeRecord):
+            return NotImplemented
+
+        return all(getattr(self, attr) == getattr(other, attr) for attr in self._ATTRS)
+
+    def __getstate__(self) -> tuple:
+        """
+        """
+        return tuple(getattr(self, attr) for attr in self._ATTRS)
+
+    def __setstate__(self, state: tuple):
+        """
+        """
+        for attr, value in zip(self._ATTRS, state):
+            setattr(self, attr, value)
+
+    @classmethod
+    def from_item(cls, item: ExchangeItem):
+        """
+        Create an instance of ``ExchangeRecord`` from an ``ExchangeItem``.
+
+        :param ExchangeItem item: The item to copy.
+
+        :rtype: ExchangeRecord
+        """
+        return cls(*[getattr(item, attr) for attr in cls._ATTRS])
+
+    def to_item(self) -> ExchangeItem:
+        """
+        Convert the instance to an ``ExchangeItem``.
+
+        The values are copied as is, skipping the conversion and validation done when setting
+        the attributes of an ``ExchangeItem``.
+
+        :rtype: ExchangeItem
+        """
+        item = ExchangeItem.__new__(ExchangeItem)
+
+        for attr in self._ATTRS:
+            setattr(item, '_' + attr, getattr(self, attr))
+
+        return item
+
+    @property
+    def date_sql(self) -> str:
+        """
+        Get ``date`` in a format accepted by MySQL's datetime field.
+
+        :rtype: str
+        """
+        return self.date.strftime(_SQL_FMT) if self.date is not None else None
+
+    @property
+    def last_date_sql(self) -> str:
+        """
+        Get ``last_date`` in a format accepted by MySQL's datetime field.
+
+        :rtype: str
+        """
+        return self.last_date.strftime(_SQL_FMT) if self.last_date is not None else None
+
+    @property
+    def volume_date_sql(self) -> str:
+        """
+        Get ``volume_date`` in a format accepted by MySQL's datetime field.
+
+        :rtype: str
+        """
+        return self.volume_date.strftime(_SQL_FMT) if self.volume_date is not None else None
+
+    # these only read the attributes, so work the same for records
+    data_key = ExchangeItem.data_key
+    to_csv_row = ExchangeItem.to_csv_row
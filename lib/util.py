@@ -5,14 +5,26 @@
 
 import argparse
 from datetime import datetime
+import json
 import logging
 import sys
 import os
 
+# optional faster json backends, the standard library is used if neither is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
 from .config import Config
 
 
-__all__ = ['setup_logging']
+__all__ = ['setup_logging', 'json_loads', 'json_dumps']
 
 
 def setup_logging(args: argparse.Namespace, config: Config, log_file_fmt: str):
@@ -56,3 +68,38 @@ def setup_logging(args: argparse.Namespace, config: Config, log_file_fmt: str):
     # force urllib to be quiet
     urllib_logger = logging.getLogger('urllib3')
     urllib_logger.setLevel(logging.WARNING)
+
+
+def json_loads(data):
+    """
+    Decode a JSON document using the fastest backend available.
+
+    :param data: The JSON document as ``bytes`` or ``str``. Passing ``bytes`` avoids decoding the
+        document to a string first when ``orjson`` is installed.
+
+    :raises ValueError: If ``data`` is not valid JSON.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+
+    if ujson is not None:
+        return ujson.loads(data)
+
+    return json.loads(data)
+
+
+def json_dumps(value) -> bytes:
+    """
+    Encode a value as UTF-8 encoded JSON using the fastest backend available.
+
+    :param value: The value to encode.
+
+    :return bytes: The encoded value.
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+
+    if ujson is not None:
+        return ujson.dumps(value, ensure_ascii=False).encode('utf-8')
+
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
@@ -0,0 +1,65 @@
+#! /usr/bin/env python3
+
+"""
+Load the CSV files written by migrateexchange.py into a local exchange database.
+"""
+
+import argparse
+from datetime import datetime
+import glob
+import logging
+import os
+
+from lib.config import Config
+from lib.rswiki.exchange_db import ExchangeData
+from lib.util import setup_logging
+
+
+LOG_FILE_FMT = 'loadexchange-{}.log'
+DB_FILENAME = 'exchange.sqlite'
+
+
+def main():
+    """
+    Program entry point.
+    """
+    args = parse_args()
+    config = Config.from_toml(args.config)
+    setup_logging(args, config, LOG_FILE_FMT)
+    logger = logging.getLogger('loadexchange')
+
+    start = datetime.utcnow()
+    paths = sorted(glob.glob(os.path.join(args.csv, '*.csv')))
+    total = 0
+
+    with ExchangeData(args.db or os.path.join(config.state_dir, DB_FILENAME)) as data:
+        for path in paths:
+            loaded = data.load_csv(path, args.dedupe)
+            logger.debug('Loaded %s prices from %s', loaded, path)
+            total += loaded
+
+    logger.info('Loaded %s prices from %s files in %s', total, len(paths),
+                str(datetime.utcnow() - start))
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Handle command line arguments.
+
+    :return: The found arguments.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--config', required=True)
+    parser.add_argument('--csv', required=True)
+    parser.add_argument('--db', required=False)
+    parser.add_argument('--dedupe', action='store_true', default=False)
+
+    group = parser.add_mutually_exclusive_group(required=False)
+    group.add_argument('-v', '--verbose', action='store_true')
+    group.add_argument('-q', '--quiet', action='store_true')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
@@ -9,9 +9,18 @@ These failed revisions can be converted to another format using:
 
 This file can then be passed in as the --file argument to retry parsing after fixes have been
 completed.
+
+To only process the modules and pages that have been changed since the last run, use the --recent
+argument. The first run processes everything that is still in recent changes.
+
+To run without access to the wiki, create an archive of the revisions using mirrorexchange.py and
+pass it in as the --offline argument. The archive doesn't include recent changes, so --recent can't
+be used with it.
 """
 
 import argparse
+from collections import Counter, deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
 import logging
 import os
 from pprint import pprint
@@ -19,17 +28,100 @@ from pprint import pprint
 from lib.config import Config
 from lib.exception import MediaWikiError, ExchangeTemplateMissingError, \
     ExchangeTemplateConvertedError
-from lib.mediawiki import Api
-from lib.rswiki import ExchangeItem
-from lib.util import setup_logging
+from lib.mediawiki import Api, OfflineApi, ResponseCache, RevisionStore
+from lib.rswiki import ExchangeColumnarWriter, ExchangeCsvWriter, ExchangeItem, \
+    ExchangeRecord, dedupe_revisions, report_unknown_attrs, take_unknown_attrs
+from lib.util import json_dumps, json_loads, setup_logging
 
 
 LOG_FILE_FMT = 'migrateexchange-{}.log'
+STATE_FILENAME = 'migrateexchange-state.json'
 EXCLUDE_PAGES = ['Module:Exchange/test']
 
 NS_EXCHANGE = 112
 NS_MODULE = 828
 
+# the number of revisions that can be waiting to be parsed before fetching pauses
+MAX_PENDING = 512
+# the number of revisions of a module parsed together, see ExchangeItem.from_module_batch
+PARSE_BATCH_SIZE = 50
+# the unknown attributes found while parsing, reported at the end of the run
+UNKNOWN_ATTRS = Counter()
+
+
+class ExportFiles:
+    """
+    Opens the files the parsed revisions of each module are written to.
+    """
+
+    def __init__(self, directory: str, fmt: str = 'csv', single_file: bool = False):
+        """
+        :param str directory: The directory to write the files to.
+        :param str fmt: The format to write, either ``csv`` or one of the formats supported by
+            ``ExchangeColumnarWriter``.
+        :param bool single_file: If ``True`` write every module to a single file. Only supported
+            by columnar formats.
+        """
+        self.directory = directory
+        self.fmt = fmt
+        self._shared = None
+
+        if single_file:
+            path = os.path.join(directory, 'exchange.' + fmt)
+            self._shared = ExchangeColumnarWriter(path, fmt)
+
+    def open(self, title: str):
+        """
+        Get the writer for a module.
+
+        :param str title: The title of the module.
+        """
+        if self._shared is not None:
+            return self._shared
+
+        filename = title.replace('Module:Exchange/', '') \
+                        .replace(' ', '_')
+        path = os.path.join(self.directory, filename + '.' + self.fmt)
+
+        if self.fmt == 'csv':
+            return ExchangeCsvWriter(path)
+
+        return ExchangeColumnarWriter(path, self.fmt)
+
+    def release(self, writer):
+        """
+        Finish writing a module.
+
+        :param writer: The writer returned by ``open``.
+        """
+        if writer is not self._shared:
+            writer.close()
+
+    def close(self):
+        """
+        Finish writing every module.
+        """
+        if self._shared is not None:
+            self._shared.close()
+
+
+class SerialExecutor(Executor):
+    """
+    A stand in for ``ProcessPoolExecutor`` that runs everything immediately in this process.
+    """
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """
+        """
+        ret = Future()
+        ret.set_result(fn(*args, **kwargs))
+        return ret
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        """
+        """
+        pass
+
 
 def main():
     """
@@ -40,15 +132,30 @@ def main():
     setup_logging(args, config, LOG_FILE_FMT)
     logger = logging.getLogger('migrateexchange')
 
-    api = Api(config.username, config.password, config.api_path)
+    cache = None
+
+    if args.offline:
+        api = OfflineApi(RevisionStore(args.offline))
+    else:
+        if config.cache_dir is not None:
+            # the pages found in recent changes have just been edited, so only take what can't
+            # change from the cache, i.e. the content of revisions, otherwise a change could be
+            # missed while the position in recent changes still moves past it
+            cache = ResponseCache(config.cache_dir, 0 if args.recent else config.cache_ttl)
+
+        api = Api(config.username, config.password, config.api_path,
+                  cookie_path=config.cookie_path, cache=cache)
 
     cur_path = os.path.dirname(os.path.abspath(__file__))
     failed_path = os.path.join(cur_path, args.failed)
     total_revisions = 0
 
     if args.csv:
-        dirname = os.path.join(cur_path, args.csv)
-        os.makedirs(dirname, exist_ok=True)
+        csv_dir = os.path.join(cur_path, args.csv)
+        os.makedirs(csv_dir, exist_ok=True)
+        exports = ExportFiles(csv_dir, args.format, args.single_file)
+    else:
+        exports = None
 
     if not args.start:
         try:
@@ -57,16 +164,40 @@ def main():
         except FileNotFoundError:
             pass
 
-    with api:
+    if args.jobs > 1:
+        executor = ProcessPoolExecutor(max_workers=args.jobs)
+    else:
+        executor = SerialExecutor()
+
+    # the worker processes are shut down even if processing fails part way through
+    with executor, api:
+        if args.recent:
+            state_path = os.path.join(config.state_dir, STATE_FILENAME)
+            state = load_state(state_path)
+            changed, new_state = get_recent_changes(api, state)
+
+            logger.info('Found %s pages changed since %s', len(changed),
+                        state.get('timestamp', 'the start of recent changes'))
+
+            for title, namespace in changed.items():
+                if namespace == NS_MODULE:
+                    if not title.startswith('Module:Exchange/'):
+                        continue
+
+                    total_revisions += process_module(api, title, exports, failed_path, executor,
+                                                      args.dedupe)
+
+                elif namespace == NS_EXCHANGE:
+                    total_revisions += process_page(api, title, failed_path, executor)
+
+            # only move the watermark once every page has been processed
+            save_state(state_path, new_state)
+
         if args.modules:
             ap_params = {'list': 'allpages',
                          'apnamespace': NS_MODULE,
                          'apprefix': 'Exchange/',
                          'aplimit': 'max'}
-            rv_params = {'prop': 'revisions',
-                         'rvprop': 'ids|content|timestamp|user|userid|comment',
-                         'rvlimit': 'max',
-                         'path': 'revisions'}
 
             if args.start:
                 ap_params['apfrom'] = args.start
@@ -74,93 +205,29 @@ def main():
             for page in api.iterator(**ap_params):
                 title = page['title']
 
-                if title.endswith('/Data') or title in EXCLUDE_PAGES:
-                    continue
-
-                title_parts = title.split('/', maxsplit=1)
-
-                if title_parts[1].startswith(('1/3', '1/2', '2/3')):
-                    with open(failed_path, 'a') as fh:
-                        fh.write('Title: {!s}: Error: Page title should contain fraction entities\n'
-                                 .format(title))
-
                 if not args.revisions:
+                    if title.endswith('/Data') or title in EXCLUDE_PAGES:
+                        continue
+
                     text = api.get_page_content(title)
                     total_revisions += 1
                     logger.debug(text)
                     check_content_module(title, text, failed_path)
                     return
                 else:
-                    rv_params['titles'] = title
-                    prev = None
-
-                    if args.csv:
-                        filename = title.replace('Module:Exchange/', '') \
-                                        .replace(' ', '_')
-                        csv_filename = os.path.join(cur_path, args.csv, filename + '.csv')
-
-                        with open(csv_filename, 'w') as fh:
-                            fh.write(','.join(ExchangeItem._ATTRS +
-                                              ('user', 'userid', 'summary', 'timestamp', 'revid')) + '\n')
-                    else:
-                        csv_filename = None
-
-                    for revision in api.iterator(**rv_params):
-                        total_revisions += 1
-                        try:
-                            text = revision['*']
-                            revision_id = revision['revid']
-                        except KeyError:
-                            logger.error(revision)
-                            raise
-
-                        item = check_content_module(title, text, failed_path, True, revision_id)
-                        extras = [revision[k] for k in ('user', 'userid', 'comment', 'timestamp', 'revid')]
-                        # convert API timestamps to SQL format
-                        extras[3] = extras[3].replace('Z', '').replace('T', ' ')
-
-                        for i, e in enumerate(extras):
-                            if isinstance(e, str):
-                                extras[i] = repr(e)
-                            else:
-                                extras[i] = str(e)
-
-                        extras = ',' + ','.join(extras)
-
-                        if csv_filename is not None:
-                            with open(csv_filename, 'a') as fh:
-                                fh.write(item.to_csv() + extras + '\n')
+                    total_revisions += process_module(api, title, exports, failed_path, executor,
+                                                      args.dedupe)
 
         if args.pages:
             ap_params = {'list': 'allpages',
                          'apnamespace': NS_EXCHANGE,
                          'aplimit': 'max'}
-            rv_params = {'prop': 'revisions',
-                         'rvprop': 'ids|content|timestamp',
-                         'rvlimit': 'max',
-                         'path': 'revisions'}
 
             if args.start:
                 ap_params['apfrom'] = args.start
 
             for page in api.iterator(**ap_params):
-                title = page['title']
-
-                if title.endswith('/Data') or title in EXCLUDE_PAGES:
-                    continue
-
-                rv_params['titles'] = title
-
-                for revision in api.iterator(**rv_params):
-                    total_revisions += 1
-                    try:
-                        text = revision['*']
-                        revision_id = revision['revid']
-                    except KeyError:
-                        logger.error(revision)
-                        raise
-
-                    check_content_page(title, text, failed_path, revision_id)
+                total_revisions += process_page(api, page['title'], failed_path, executor)
 
         if args.file:
             with open(args.file) as fh, api:
@@ -177,6 +244,16 @@ def main():
                     elif namespace == NS_EXCHANGE:
                         check_content_page(title, content, failed_path, revision_id)
 
+    if exports is not None:
+        exports.close()
+
+    logger.info('Total revisions: %s', total_revisions)
+    # anything parsed in this process rather than by parse_in_order
+    UNKNOWN_ATTRS.update(take_unknown_attrs())
+    logger.info(report_unknown_attrs(UNKNOWN_ATTRS))
+
+    if cache is not None:
+        logger.info('Cache hits: %s, cache misses: %s', cache.hits, cache.misses)
 
 
 def parse_args() -> argparse.Namespace:
@@ -192,6 +269,13 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument('--revisions', action='store_true', default=False)
     parser.add_argument('--file', required=False)
     parser.add_argument('--csv', required=False)
+    parser.add_argument('--offline', required=False)
+    parser.add_argument('--recent', action='store_true', default=False)
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    parser.add_argument('--format', choices=('csv',) + ExchangeColumnarWriter.FORMATS,
+                        default='csv')
+    parser.add_argument('--single-file', action='store_true', default=False)
+    parser.add_argument('--dedupe', action='store_true', default=False)
 
     group = parser.add_mutually_exclusive_group(required=False)
     group.add_argument('--modules', action='store_true')
@@ -204,6 +288,9 @@ def parse_args() -> argparse.Namespace:
 
     args = parser.parse_args()
 
+    if args.offline and args.recent:
+        parser.error('--recent is not supported with --offline, the archive has no recent changes')
+
     if args.both:
         args.pages = True
         args.modules = True
@@ -211,9 +298,253 @@ def parse_args() -> argparse.Namespace:
     if args.pages:
         args.revisions = True
 
+    if args.single_file and args.format == 'csv':
+        parser.error('--single-file is only supported by columnar formats')
+
     return args
 
 
+def process_module(api, title: str, exports: ExportFiles, failed_path: str, executor,
+                   dedupe: bool = False) -> int:
+    """
+    Parse every revision of an exchange module.
+
+    Revisions are fetched in this process and parsed using ``executor``, ``PARSE_BATCH_SIZE`` at
+    a time. The parsed revisions are written out in the order they were fetched, which is newest
+    first unless ``dedupe`` is set.
+
+    :param api: The API to fetch revisions from.
+    :param str title: The title of the module.
+    :param ExportFiles exports: The files to write the parsed revisions to, if any.
+    :param str failed_path: The file to report problems with the module to.
+    :param executor: The executor to parse revisions with.
+    :param bool dedupe: If ``True`` fetch the revisions oldest first and only write the oldest of
+        each run of revisions with the same data.
+
+    :return int: The number of revisions found.
+    """
+    logger = logging.getLogger('migrateexchange')
+
+    if title.endswith('/Data') or title in EXCLUDE_PAGES:
+        return 0
+
+    title_parts = title.split('/', maxsplit=1)
+
+    if title_parts[1].startswith(('1/3', '1/2', '2/3')):
+        with open(failed_path, 'a') as fh:
+            fh.write('Title: {!s}: Error: Page title should contain fraction entities\n'
+                     .format(title))
+
+    rv_params = {'titles': title,
+                 'rvprop': 'ids|content|timestamp|user|userid|comment',
+                 'rvlimit': 'max'}
+    total_revisions = 0
+
+    if dedupe:
+        # a run has to be followed forwards in time to keep the revision that started it
+        rv_params['rvdir'] = 'newer'
+
+    writer = exports.open(title) if exports is not None else None
+
+    def tasks():
+        batch = []
+        revisions = []
+
+        for revision in api.iter_revisions(**rv_params):
+            try:
+                # the content isn't needed once it's been handed over
+                batch.append((revision.pop('*'), revision['revid']))
+            except KeyError:
+                logger.error(revision)
+                raise
+
+            revisions.append(revision)
+
+            if len(batch) >= PARSE_BATCH_SIZE:
+                yield check_content_modules, (title, batch, failed_path), revisions
+                batch = []
+                revisions = []
+
+        if batch:
+            yield check_content_modules, (title, batch, failed_path), revisions
+
+    def parsed():
+        for revisions, items in parse_in_order(executor, tasks(),
+                                               MAX_PENDING // PARSE_BATCH_SIZE):
+            yield from zip(revisions, items)
+
+    results = parsed()
+    stats = {}
+
+    if dedupe:
+        results = dedupe_revisions(results, stats)
+
+    try:
+        for revision, item in results:
+            total_revisions += 1
+
+            # failures and redirects are reported when parsing, so there's nothing to write
+            if writer is not None and item is not None:
+                writer.write(item, revision, title)
+    finally:
+        if writer is not None:
+            exports.release(writer)
+
+    if dedupe:
+        total_revisions += stats['dropped']
+        logger.debug('Dropped %s duplicate revisions of %s', stats['dropped'], title)
+
+    return total_revisions
+
+
+def process_page(api, title: str, failed_path: str, executor) -> int:
+    """
+    Parse every revision of an exchange page.
+
+    :param api: The API to fetch revisions from.
+    :param str title: The title of the page.
+    :param str failed_path: The file to report problems with the page to.
+    :param executor: The executor to parse revisions with.
+
+    :return int: The number of revisions found.
+    """
+    logger = logging.getLogger('migrateexchange')
+
+    if title.endswith('/Data') or title in EXCLUDE_PAGES:
+        return 0
+
+    rv_params = {'titles': title,
+                 'rvprop': 'ids|content|timestamp',
+                 'rvlimit': 'max'}
+    total_revisions = 0
+
+    def tasks():
+        for revision in api.iter_revisions(**rv_params):
+            try:
+                text = revision.pop('*')
+                revision_id = revision['revid']
+            except KeyError:
+                logger.error(revision)
+                raise
+
+            yield check_content_page, (title, text, failed_path, revision_id), revision
+
+    for revision, item in parse_in_order(executor, tasks()):
+        total_revisions += 1
+
+    return total_revisions
+
+
+def parse_in_order(executor, tasks, max_pending: int = MAX_PENDING):
+    """
+    Run tasks using ``executor``, yielding the results in the same order as the tasks.
+
+    Tasks are consumed while earlier ones are still running, so fetching revisions and parsing
+    them happen at the same time. Any unknown attributes found by the tasks are added to
+    ``UNKNOWN_ATTRS``.
+
+    :param executor: The executor to run the tasks with.
+    :param tasks: An iterable of ``(function, args, context)`` tuples.
+    :param int max_pending: The number of tasks that can be waiting before no more are taken.
+
+    :return: A generator of ``(context, result)`` tuples.
+    """
+    pending = deque()
+
+    def result(future):
+        ret, unknown_attrs = future.result()
+        UNKNOWN_ATTRS.update(unknown_attrs)
+        return ret
+
+    for fn, args, context in tasks:
+        pending.append((context, executor.submit(run_task, fn, *args)))
+
+        # hand back anything that's finished, waiting if too far behind
+        while pending and (pending[0][1].done() or len(pending) > max_pending):
+            context, future = pending.popleft()
+            yield context, result(future)
+
+    while pending:
+        context, future = pending.popleft()
+        yield context, result(future)
+
+
+def run_task(fn, *args) -> tuple:
+    """
+    Run a task for ``parse_in_order``, which may be in a worker process.
+
+    :return tuple: The result of the task, and the unknown attributes it found, which would
+        otherwise be lost if it was run in a worker process.
+    """
+    return fn(*args), take_unknown_attrs()
+
+
+def get_recent_changes(api, state: dict) -> tuple:
+    """
+    Find the exchange modules and pages that have been changed since the last run.
+
+    :param api: The API to fetch recent changes from.
+    :param dict state: The state saved by the last run, containing the ``timestamp`` and ``rcid``
+        of the last change that was seen. If empty, every change still in recent changes is used.
+
+    :return tuple: A dictionary mapping the changed titles to their namespace, in the order they
+        were first changed, and the state to save once they have been processed.
+    """
+    rc_params = {'list': 'recentchanges',
+                 'rcnamespace': '{}|{}'.format(NS_EXCHANGE, NS_MODULE),
+                 'rcprop': 'title|ids|timestamp',
+                 'rctype': 'edit|new',
+                 'rcdir': 'newer',
+                 'rclimit': 'max'}
+    last_rcid = state.get('rcid', 0)
+    new_state = dict(state)
+    ret = {}
+
+    if 'timestamp' in state:
+        rc_params['rcstart'] = state['timestamp']
+
+    for change in api.iterator(**rc_params):
+        # rcstart is inclusive, so skip anything seen by the last run
+        if change['rcid'] <= last_rcid:
+            continue
+
+        ret.setdefault(change['title'], change['ns'])
+        new_state['timestamp'] = change['timestamp']
+        new_state['rcid'] = max(change['rcid'], new_state.get('rcid', 0))
+
+    return ret, new_state
+
+
+def load_state(path: str) -> dict:
+    """
+    Load the state saved by the last incremental run.
+
+    :param str path: The file the state is saved in.
+
+    :return dict: The saved state, or an empty dictionary if there isn't any.
+    """
+    try:
+        with open(path, 'rb') as fh:
+            return json_loads(fh.read())
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(path: str, state: dict):
+    """
+    Save the state for the next incremental run.
+
+    :param str path: The file to save the state in.
+    :param dict state: The state to save.
+    """
+    tmp_path = path + '.tmp'
+
+    with open(tmp_path, 'wb') as fh:
+        fh.write(json_dumps(state))
+
+    os.replace(tmp_path, path)
+
+
 def check_content_module(title: str, text: str, failed_path: str,
                          allow_category_nil: bool = False, revision_id: int = None):
     """
@@ -237,8 +568,42 @@ def check_content_module(title: str, text: str, failed_path: str,
         return None
     else:
         logger.debug('Parsed %s successfully', title)
-        return item
+        # records are cheaper to send back from worker processes and to hold
+        return ExchangeRecord.from_item(item)
+
+
+def check_content_modules(title: str, revisions: list, failed_path: str) -> list:
+    """
+    Parse many revisions of an exchange module at once, see ``ExchangeItem.from_module_batch``.
+
+    Revisions that can't be parsed are parsed again by ``check_content_module``, so they are
+    reported in the same way as when parsing one at a time.
+
+    :param str title: The title of the module.
+    :param list revisions: The revisions as ``(text, revision_id)`` tuples.
+    :param str failed_path: The file to report problems with the module to.
+
+    :return list: An ``ExchangeRecord`` for each revision, or ``None`` for redirects and
+        revisions that couldn't be parsed.
+    """
+    ret = [None] * len(revisions)
+    # ignore redirects
+    indexes = [i for i, (text, _) in enumerate(revisions)
+               if not text.upper().startswith('#REDIRECT')]
+    items = ExchangeItem.from_module_batch((revisions[i][0] for i in indexes),
+                                           allow_category_nil=True)
+
+    for i, item in zip(indexes, items):
+        if item is None:
+            text, revision_id = revisions[i]
+            ret[i] = check_content_module(title, text, failed_path, True, revision_id)
+        else:
+            # records are cheaper to send back from worker processes and to hold
+            ret[i] = ExchangeRecord.from_item(item)
+
+    logging.getLogger('migrateexchange').debug('Parsed %s revisions of %s', len(indexes), title)
 
+    return ret
 
 
 def check_content_page(title: str, text: str, failed_path: str,
@@ -267,7 +632,7 @@ def check_content_page(title: str, text: str, failed_path: str,
         return None
     else:
         logger.info('Parsed %s successfully', title)
-        return item
+        return ExchangeRecord.from_item(item)
 
 
 if __name__ == '__main__':
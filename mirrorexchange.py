@@ -0,0 +1,83 @@
+#! /usr/bin/env python3
+
+"""
+Mirror the histories of the exchange modules and pages to a local archive.
+
+Only revisions made since the previous run are requested, so this can be run regularly to keep
+the archive up to date. The archive can be used by migrateexchange.py with the --offline argument.
+"""
+
+import argparse
+from datetime import datetime
+import logging
+import os
+
+from lib.config import Config
+from lib.mediawiki import Api, RevisionStore
+from lib.util import setup_logging
+
+
+LOG_FILE_FMT = 'mirrorexchange-{}.log'
+ARCHIVE_FILENAME = 'exchange-revisions.sqlite'
+
+NS_EXCHANGE = 112
+NS_MODULE = 828
+
+
+def main():
+    """
+    Program entry point.
+    """
+    args = parse_args()
+    config = Config.from_toml(args.config)
+    setup_logging(args, config, LOG_FILE_FMT)
+    logger = logging.getLogger('mirrorexchange')
+
+    api = Api(config.username, config.password, config.api_path, cookie_path=config.cookie_path)
+    store = RevisionStore(args.archive or os.path.join(config.state_dir, ARCHIVE_FILENAME))
+    start = datetime.utcnow()
+    total = 0
+
+    try:
+        with api:
+            if args.modules:
+                total += store.sync(api, NS_MODULE, prefix='Exchange/', start=args.start)
+
+            if args.pages:
+                total += store.sync(api, NS_EXCHANGE, start=args.start)
+    finally:
+        store.close()
+        logger.info('Added %s revisions in %s', total, str(datetime.utcnow() - start))
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Handle command line arguments.
+
+    :return: The found arguments.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--config', required=True)
+    parser.add_argument('--archive', required=False)
+    parser.add_argument('--start', required=False)
+
+    group = parser.add_mutually_exclusive_group(required=False)
+    group.add_argument('--modules', action='store_true')
+    group.add_argument('--pages', action='store_true')
+    group.add_argument('--both', action='store_true')
+
+    group = parser.add_mutually_exclusive_group(required=False)
+    group.add_argument('-v', '--verbose', action='store_true')
+    group.add_argument('-q', '--quiet', action='store_true')
+
+    args = parser.parse_args()
+
+    if args.both or not (args.modules or args.pages):
+        args.pages = True
+        args.modules = True
+
+    return args
+
+
+if __name__ == '__main__':
+    main()
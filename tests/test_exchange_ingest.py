@@ -0,0 +1,163 @@
+#
+
+"""
+Tests for ingesting prices from the Grand Exchange catalogue, using the responses in
+``fixtures/catalogue``.
+"""
+
+from datetime import datetime
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+from lib.exception import ExchangeError
+from lib.rswiki import CatalogueSource, ExchangeCategory, ExchangeIngest, FixtureSource
+from lib.rswiki.exchange_db import ExchangeData
+from lib.rswiki.exchange_ingest import _parse_price
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'catalogue')
+# runeday 8635 of info.json
+UPDATE_DATE = datetime(2025, 10, 19)
+
+
+class TestParsePrice(unittest.TestCase):
+    """
+    """
+
+    def test_exact(self):
+        for value, expected in [(5, 5), ('23', 23), ('1,234', 1234), (' 999 ', 999)]:
+            self.assertEqual(_parse_price(value), expected)
+
+    def test_abbreviated(self):
+        for value in ['12.3k', '1.2m', '2.1B', '1,000.5k']:
+            self.assertIsNone(_parse_price(value))
+
+    def test_invalid(self):
+        for value in ['', 'x', 'x.k', '1.2']:
+            with self.assertRaises(ValueError):
+                _parse_price(value)
+
+
+class TestSources(unittest.TestCase):
+    """
+    """
+
+    def test_fixture_not_found(self):
+        source = FixtureSource(FIXTURES)
+
+        with self.assertRaisesRegex(ExchangeError, 'No fixture found'):
+            source.items(3, 'c', 1)
+
+        self.assertEqual(source.total_requests, 1)
+        self.assertEqual(source.error_requests, 1)
+
+    def test_retry(self):
+        res = mock.Mock(content=b'{"lastConfigUpdateRuneday": 8635}')
+        source = CatalogueSource(max_retries=2, backoff=0)
+
+        with mock.patch('requests.get', side_effect=[requests.ConnectionError, ValueError, res]), \
+                self.assertLogs('lib.rswiki.exchange_ingest', 'WARNING'):
+            self.assertEqual(source.info(), {'lastConfigUpdateRuneday': 8635})
+
+        self.assertEqual(source.total_requests, 3)
+        self.assertEqual(source.error_requests, 2)
+
+    def test_too_many_retries(self):
+        source = CatalogueSource(max_retries=2, backoff=0)
+
+        with mock.patch('requests.get', side_effect=requests.Timeout) as get, \
+                self.assertLogs('lib.rswiki.exchange_ingest', 'WARNING'), \
+                self.assertRaises(ExchangeError):
+            source.info()
+
+        self.assertEqual(get.call_count, 3)
+        self.assertEqual(source.error_requests, 3)
+
+
+class TestExchangeIngest(unittest.TestCase):
+    """
+    """
+
+    def setUp(self):
+        self.ingest = ExchangeIngest(FixtureSource(FIXTURES), jobs=2)
+
+    def test_update_date(self):
+        self.assertEqual(self.ingest.update_date(), UPDATE_DATE)
+
+    def test_fetch_category(self):
+        with self.assertLogs('lib.rswiki.exchange_ingest', 'WARNING'):
+            items = self.ingest.fetch_category(ExchangeCategory.BOLTS)
+
+        # the item without a price is skipped
+        self.assertEqual([i.item_id for i in items], [9143, 9144, 877])
+        self.assertEqual([i.price for i in items], [1234, None, 23])
+        self.assertEqual([i.members for i in items], [True, True, False])
+
+        for item in items:
+            self.assertEqual(item.category, ExchangeCategory.BOLTS)
+            self.assertEqual(item.date, UPDATE_DATE)
+
+        # one for the category and one for each page, none for the letter without items
+        self.assertEqual(self.ingest.metrics[ExchangeCategory.BOLTS]['requests'], 3)
+
+    def test_missing_category(self):
+        with self.assertLogs('lib.rswiki.exchange_ingest', 'WARNING'), \
+                self.assertRaises(ExchangeError):
+            self.ingest.fetch([ExchangeCategory.BOLTS, ExchangeCategory.ARROWS])
+
+
+class TestLoad(unittest.TestCase):
+    """
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data = ExchangeData(os.path.join(self.directory, 'exchange.sqlite'))
+        self.ingest = ExchangeIngest(FixtureSource(FIXTURES))
+
+    def tearDown(self):
+        self.data.close()
+        shutil.rmtree(self.directory)
+
+    def load(self) -> int:
+        with self.assertLogs('lib.rswiki.exchange_ingest', 'WARNING'):
+            return self.ingest.load(self.data, [ExchangeCategory.BOLTS])
+
+    def test_columns(self):
+        self.data.load_item_rows([(9143, 'Old name', 100, 10000, 0, None, 1, 'Old examine',
+                                   'Crossbow', '2019-05-13 04:23:00')])
+
+        self.assertEqual(self.load(), 3)
+        rows = self.data.conn.execute('SELECT item_id, item, value, "limit", members, category, '
+                                      'alchable, examine, usage, date FROM items '
+                                      'ORDER BY item_id').fetchall()
+
+        self.assertEqual(rows, [
+            (877, 'Bronze bolts', None, None, 0, 3, None, 'Bronze crossbow bolts.', None,
+             '2025-10-19 00:00:00'),
+            # the columns the catalogue doesn't know are kept
+            (9143, 'Adamant bolts', 100, 10000, 1, 3, 1, 'Adamantite crossbow bolts.',
+             'Crossbow', '2025-10-19 00:00:00'),
+            (9144, 'Runite bolts', None, None, 1, 3, None, 'Runite crossbow bolts.', None,
+             '2025-10-19 00:00:00'),
+        ])
+
+    def test_history(self):
+        self.load()
+        # loading again before the next update replaces the prices rather than adding to them
+        self.load()
+        rows = self.data.conn.execute('SELECT item_id, date, price FROM price_history '
+                                      'ORDER BY item_id').fetchall()
+
+        # the abbreviated price isn't stored
+        self.assertEqual(rows, [(877, '2025-10-19 00:00:00', 23),
+                                (9143, '2025-10-19 00:00:00', 1234)])
+
+
+if __name__ == '__main__':
+    unittest.main()
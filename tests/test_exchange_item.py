@@ -0,0 +1,134 @@
+#
+
+"""
+Tests for reading and writing exchange modules.
+"""
+
+import io
+import unittest
+
+from lib.rswiki import ExchangeItem
+
+
+# modules as they are found on the wiki, including the keys that are ignored
+MODULES = [
+    """return {
+    itemId     = 554,
+    price      = 4,
+    last       = 5,
+    date       = '04:23, May 13, 2019 (UTC)',
+    lastDate   = '03:48, May 12, 2019 (UTC)',
+    volume     = 8.4,
+    volumeDate = '12:00, May 10, 2019 (UTC)',
+    icon       = 'Fire rune.png',
+    item       = 'Fire rune',
+    value      = 17,
+    limit      = 25000,
+    members    = false,
+    category   = 'Runes, Spells and Teleports',
+    alchable   = true,
+    examine    = 'One of the 4 basic elemental Runes.',
+    usage      = {
+        'Fire battlestaff',
+        'Lava rune'
+    }
+}
+""",
+    r"""-- [[Category:Exchange data]]
+return {
+    itemId = 20859,
+    price = '1,234,567',
+    date = '14:05, 3 June 2014 (UTC)',
+    item = "Dragon's \\breath\" potion\t\65",
+    value = 2e3,
+    members = 'yes',
+    category = nil,
+    examine = [[A long
+string]],
+    usage = {}
+}
+""",
+]
+
+
+class TestFromModule(unittest.TestCase):
+    """
+    """
+
+    def test_positional_values_ignored(self):
+        """
+        Positional values are keyed by their index, which doesn't set anything.
+        """
+        text = "return { itemId = 1, price = 5, 'stray', item = 'Foo' }"
+        item = ExchangeItem.from_module(text)
+
+        self.assertEqual(item.item, 'Foo')
+        self.assertEqual(item.item_id, 1)
+        self.assertEqual(item.price, 5)
+
+
+class TestToModule(unittest.TestCase):
+    """
+    """
+
+    def assertSameItem(self, first, second):
+        """
+        """
+        for attr in ExchangeItem._ATTRS:
+            self.assertEqual(getattr(first, attr), getattr(second, attr), attr)
+
+    def test_round_trip(self):
+        """
+        Modules written by ``to_module`` are read back by ``from_module`` unchanged.
+        """
+        for text in MODULES:
+            item = ExchangeItem.from_module(text, allow_category_nil=True)
+            module = item.to_module()
+
+            self.assertSameItem(ExchangeItem.from_module(module, allow_category_nil=True), item)
+            # writing it again gives the same module
+            self.assertEqual(ExchangeItem.from_module(module, allow_category_nil=True)
+                             .to_module(), module)
+
+    def test_round_trip_escapes(self):
+        """
+        Strings are quoted so any character survives being written to a module.
+        """
+        strings = ["It's a \\ backslash", 'Two\nlines\r\n', 'tab\there', 'null\x00 and \x7f',
+                   '\x01' + '2', ']] and [[', '"double" quotes', 'Ąčċëñţş ☃ 𝄞', 'x' * 5000]
+
+        for value in strings:
+            item = ExchangeItem(item='Fire rune', item_id=554, examine=value, usage=[value, 'b'])
+            parsed = ExchangeItem.from_module(item.to_module())
+
+            self.assertEqual(parsed.examine, value)
+            self.assertEqual(parsed.usage, [value, 'b'])
+
+    def test_round_trip_extra(self):
+        """
+        Fields that aren't attributes can be kept when the module is written again.
+        """
+        extra = {}
+        item = ExchangeItem.from_module(MODULES[0], allow_category_nil=True, extra=extra)
+
+        self.assertEqual(extra, {'icon': 'Fire rune.png'})
+
+        extra['if'] = {1: 'a', 'b': None}
+        parsed = {}
+        ExchangeItem.from_module(item.to_module(extra), allow_category_nil=True, extra=parsed)
+
+        self.assertEqual(parsed, extra)
+
+    def test_write_modules(self):
+        """
+        ``write_modules`` writes the same modules as ``to_module``, separated by ``--`` lines.
+        """
+        items = [ExchangeItem.from_module(text, allow_category_nil=True) for text in MODULES]
+        stream = io.StringIO()
+
+        self.assertEqual(ExchangeItem.write_modules(items, stream), len(items))
+        self.assertEqual(stream.getvalue().split('--\n'), [i.to_module() for i in items])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,247 @@
+#! /usr/bin/env python3
+
+"""
+Update the exchange modules from the local exchange database.
+
+Each item's module is rendered from its stored data and compared to the current content of the
+module, which is fetched in batches. Only modules whose data has changed are edited, keeping any
+fields that aren't stored, such as icon. Modules that can't be parsed are skipped and listed
+rather than being replaced. Modules that don't exist are listed but only created with --create.
+
+Edits are made through a queue saved to state_dir, so an interrupted run can be resumed by running
+this again. Use --restart to discard any pending edits and compare every module again. Edits to
+modules that were changed on the wiki after they were compared are skipped rather than overwriting
+the change.
+
+Use --export FILE to write the module of every item to FILE instead, without fetching or editing
+anything.
+"""
+
+import argparse
+from datetime import datetime
+import difflib
+import logging
+import os
+
+from lib.config import Config
+from lib.mediawiki import Api, EditQueue
+from lib.rswiki import ExchangeCategory, ExchangeItem
+from lib.rswiki.exchange_db import ExchangeData
+from lib.util import setup_logging
+
+
+LOG_FILE_FMT = 'updateexchange-{}.log'
+DB_FILENAME = 'exchange.sqlite'
+QUEUE_FILENAME = 'updateexchange-queue.json'
+MODULE_PREFIX = 'Module:Exchange/'
+SUMMARY = 'Updating exchange data'
+
+
+def main():
+    """
+    Program entry point.
+    """
+    args = parse_args()
+    config = Config.from_toml(args.config)
+    setup_logging(args, config, LOG_FILE_FMT)
+    logger = logging.getLogger('updateexchange')
+
+    if args.export:
+        with ExchangeData(args.db or os.path.join(config.state_dir, DB_FILENAME)) as data, \
+                open(args.export, 'w', encoding='utf-8') as fh:
+            items = (i for i in data.current_items() if i.item and i.price is not None)
+            total = ExchangeItem.write_modules(items, fh)
+
+        logger.info('Exported %s modules to %s', total, args.export)
+        return
+
+    api = Api(config.username, config.password, config.api_path, cookie_path=config.cookie_path)
+    queue = EditQueue(args.queue or os.path.join(config.state_dir, QUEUE_FILENAME),
+                      interval=args.interval)
+    start = datetime.utcnow()
+    made = 0
+
+    with api:
+        if queue and not args.restart and not args.dry_run:
+            logger.info('Resuming %s pending edits', len(queue))
+
+        else:
+            with ExchangeData(args.db or os.path.join(config.state_dir, DB_FILENAME)) as data:
+                items = [i for i in data.current_items() if i.item and i.price is not None]
+
+            logger.info('Comparing %s modules', len(items))
+            skipped = []
+            missing = []
+            changes = find_changes(api, items, args.batch_size, skipped, args.create, missing)
+
+            if args.dry_run:
+                changed = 0
+
+                for title, current, text in changes:
+                    diff = difflib.unified_diff((current['content'] or '').splitlines(),
+                                                text.splitlines(), title, title, lineterm='')
+                    logger.debug('\n'.join(diff))
+                    changed += 1
+
+                logger.info('%s of %s modules would be edited', changed, len(items))
+                log_skipped(logger, skipped, missing)
+                return
+
+            queue.clear()
+
+            for title, current, text in changes:
+                queue.add(title, text, args.summary, current['timestamp'],
+                          current['starttimestamp'], create=current['content'] is None)
+
+            queue.save()
+            logger.info('Queued %s of %s modules to be edited', len(queue), len(items))
+            log_skipped(logger, skipped, missing)
+
+        made = queue.run(api, args.limit)
+
+    logger.info('Edited %s modules in %s, %s failed, %s still pending', made,
+                str(datetime.utcnow() - start), len(queue.failed), len(queue))
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Handle command line arguments.
+
+    :return: The found arguments.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--config', required=True)
+    parser.add_argument('--db', required=False)
+    parser.add_argument('--queue', required=False)
+    parser.add_argument('--summary', default=SUMMARY)
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--interval', type=float, default=1.0)
+    parser.add_argument('--limit', type=int, required=False)
+    parser.add_argument('--restart', action='store_true', default=False)
+    parser.add_argument('--dry-run', action='store_true', default=False)
+    parser.add_argument('--export', required=False)
+    parser.add_argument('--create', action='store_true', default=False)
+
+    group = parser.add_mutually_exclusive_group(required=False)
+    group.add_argument('-v', '--verbose', action='store_true')
+    group.add_argument('-q', '--quiet', action='store_true')
+
+    return parser.parse_args()
+
+
+def log_skipped(logger, skipped: list, missing: list = ()):
+    """
+    Log the modules that were skipped as they couldn't be parsed or don't exist.
+    """
+    if skipped:
+        logger.warning('Skipped %s modules that could not be parsed: %s', len(skipped),
+                       ', '.join(skipped))
+
+    if missing:
+        logger.warning('Skipped %s modules that do not exist, use --create to create them: %s',
+                       len(missing), ', '.join(missing))
+
+
+def find_changes(api, items: list, batch_size: int, skipped: list = None, create: bool = False,
+                 missing: list = None):
+    """
+    Find the modules whose data differs from the given items.
+
+    Fields of the current module that aren't attributes of ``ExchangeItem``, e.g. ``icon``, are
+    kept in the new content. Modules that can't be parsed are never replaced.
+
+    :param Api api: The API to fetch the current modules from.
+    :param list items: The items to compare, as ``ExchangeItem``.
+    :param int batch_size: The number of modules to fetch at once.
+    :param list skipped: If given, the titles of modules that couldn't be parsed are added to it.
+    :param bool create: Whether to create modules that don't exist.
+    :param list missing: If given, the titles of modules that don't exist and aren't being created
+        are added to it.
+
+    :return: A generator of ``(title, current, new_text)`` tuples, where ``current`` is the
+        current revision of the module as returned by ``Api.get_pages_revision``. Its ``content``
+        is ``None`` if the module does not exist.
+    """
+    for i in range(0, len(items), batch_size):
+        batch = {MODULE_PREFIX + item.item: item for item in items[i:i + batch_size]}
+        revisions = api.get_pages_revision(batch, batch_size)
+
+        for title, item in batch.items():
+            current = revisions.get(title)
+            extra = {}
+
+            if current is None:
+                # the API returned nothing for the title, so neither edit nor create it
+                if skipped is not None:
+                    skipped.append(title)
+
+                continue
+
+            old_text = current['content']
+
+            if old_text is None and not create:
+                if missing is not None:
+                    missing.append(title)
+
+                continue
+
+            if old_text is not None:
+                parsed = parse_module(title, old_text, extra)
+
+                if parsed is None:
+                    if skipped is not None:
+                        skipped.append(title)
+
+                    continue
+
+                item = merge_items(item, parsed)
+
+                # only the data matters, not how the module is formatted
+                if all(getattr(item, a) == getattr(parsed, a) for a in ExchangeItem._ATTRS):
+                    continue
+
+            yield title, current, item.to_module(extra)
+
+
+def parse_module(title: str, text: str, extra: dict = None) -> ExchangeItem:
+    """
+    Parse the current content of a module.
+
+    :param str title: The title of the module, for logging.
+    :param str text: The content of the module.
+    :param dict extra: If given, the fields that aren't attributes of ``ExchangeItem`` are added
+        to it, see ``ExchangeItem.from_module``.
+
+    :return ExchangeItem: The parsed module, or ``None`` if it does not exist or could not be
+        parsed.
+    """
+    if text is None:
+        return None
+
+    try:
+        return ExchangeItem.from_module(text, allow_category_nil=True, extra=extra)
+    except (ValueError, AttributeError, TypeError) as exc:
+        logging.getLogger('updateexchange').warning('Unable to parse %s: %s', title, exc)
+        return None
+
+
+def merge_items(item: ExchangeItem, current: ExchangeItem) -> ExchangeItem:
+    """
+    Fill in any data missing from the database using the current module.
+
+    :param ExchangeItem item: The item from the database. This is updated in place.
+    :param ExchangeItem current: The item parsed from the current module.
+
+    :rtype: ExchangeItem
+    """
+    for attr in ExchangeItem._ATTRS:
+        value = getattr(item, attr)
+
+        if value is None or value == [] or value is ExchangeCategory.UNKNOWN:
+            setattr(item, attr, getattr(current, attr))
+
+    return item
+
+
+if __name__ == '__main__':
+    main()